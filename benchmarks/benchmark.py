@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    benchmark - measure the message dispatch path of the bots
+    (handleMessage -> handler -> sendMessage) using an in-memory transport
+    Part of the InnoXMPP framework
+
+    Run from the repository root:
+
+        python3 -m benchmarks.benchmark [--save-baseline] [--iterations N]
+
+    The results are compared against benchmarks/baseline.json (if it
+    exists), the script exits with 1 if a benchmark regressed.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import sleekxmpp
+
+from bots.GitBot import GitBot
+from bots.LinuxBot import LinuxBot
+from framework.InMemoryTransport import InMemoryTransport
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "baseline.json")
+
+
+class BenchmarkGitBot(InMemoryTransport, GitBot):
+    """
+    GitBot without network connection
+    """
+    pass
+
+
+class BenchmarkLinuxBot(InMemoryTransport, LinuxBot):
+    """
+    LinuxBot without network connection
+    """
+    pass
+
+
+class StreamManagementBot(InMemoryTransport, LinuxBot):
+    """
+    LinuxBot without network connection, with stream management
+    """
+    pass
+
+
+def writeConfig(workDir):
+    """
+    write config file for the benchmark bots, return its path
+    """
+    # no merging window and no rate limits, they would dominate latency;
+    # no SSLv3 and no state written outside of workDir
+    common = """jid=benchmark@example.com
+password=benchmark
+openfire=0
+rosterfile=
+loglevel=WARNING
+sendwindow=0
+sendrate=1000000
+sendburst=1000000
+sendglobalrate=1000000
+sendglobalburst=1000000
+taskjitter=0
+alertstatefile=%s
+""" % os.path.join(workDir, "alerts.json")
+
+    # the bots read the section named after their class
+    configFile = os.path.join(workDir, "benchmark.ini")
+    with open(configFile, "w") as config:
+        config.write("[%s]\n%sstreammanagement=0\ngitdir=%s\n"
+            "fetchinterval=0\n\n" % (BenchmarkGitBot.__name__, common,
+            os.path.join(workDir, "clones")))
+        config.write("[%s]\n%sstreammanagement=0\nfsdirs=%s\n\n" % (
+            BenchmarkLinuxBot.__name__, common, workDir))
+        config.write("[%s]\n%sstreammanagement=1\nfsdirs=%s\n" % (
+            StreamManagementBot.__name__, common, workDir))
+    return configFile
+
+
+def git(arguments, cwd):
+    """
+    run git command for the benchmark setup
+    """
+    subprocess.check_call(["git"] + arguments, cwd=cwd,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def setUpRepositories(workDir):
+    """
+    create a local bare repository and a clone of it
+    """
+    bareDir = os.path.join(workDir, "origin.git")
+    cloneDir = os.path.join(workDir, "clones")
+    os.makedirs(cloneDir)
+
+    git(["init", "--bare", "-q", bareDir], workDir)
+    git(["clone", "-q", bareDir, "bench"], cloneDir)
+
+    repository = os.path.join(cloneDir, "bench")
+    git(["config", "user.email", "benchmark@example.com"], repository)
+    git(["config", "user.name", "Benchmark"], repository)
+    with open(os.path.join(repository, "README"), "w") as readme:
+        readme.write("benchmark\n")
+    git(["add", "README"], repository)
+    git(["commit", "-q", "-m", "initial"], repository)
+    git(["push", "-q", "origin", "HEAD"], repository)
+
+
+def startBot(botclass, configFile):
+    """
+    create and start bot with the in-memory transport
+    """
+    bot = botclass()
+    bot.configoptions["config"] = configFile
+    bot.run(block=False)
+    return bot
+
+
+def checkStreamManagement(configFile):
+    """
+    start a bot with stream management (XEP-0198) and check that messages
+    are held back while disconnected and sent after the stream was
+    resumed, raises RuntimeError if not
+    """
+    bot = startBot(StreamManagementBot, configFile)
+    try:
+        if "xep_0198" not in bot.plugin:
+            raise RuntimeError("Stream management plugin not loaded")
+
+        recipient = sleekxmpp.jid.JID("admin@example.com/benchmark")
+        outboxIndex = len(bot.outbox)
+        bot.event("disconnected", direct=True)
+        bot.sendMessage(recipient, "held back")
+        if bot.waitForMessage(outboxIndex, timeout=1) != None:
+            raise RuntimeError("Message sent while disconnected")
+
+        bot.event("session_resumed", direct=True)
+        if bot.waitForMessage(outboxIndex, timeout=10) == None:
+            raise RuntimeError("Message not sent after the stream was resumed")
+    finally:
+        bot.shutdown()
+
+
+def percentile(values, q):
+    """
+    return the q-th percentile of sorted values
+    """
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def measure(bot, command, iterations, predicate=None, cached=False):
+    """
+    send command iterations times and wait for the matching reply,
+    return messages per second and p50/p99 latency in milliseconds
+
+    Unless cached is set, cached replies are dropped before every
+    message, so read-only commands run their handler each time
+    """
+    latencies = []
+    startTime = time.time()
+    for _ in range(iterations):
+        if not cached:
+            bot.commandCache.invalidate()
+        outboxIndex = len(bot.outbox)
+        sentTime = time.time()
+        bot.deliver(command)
+        reply = bot.waitForMessage(outboxIndex, predicate)
+        if reply == None:
+            raise RuntimeError("No reply for '%s'" % command)
+        latencies.append((reply[0] - sentTime) * 1000)
+    totalTime = time.time() - startTime
+
+    latencies.sort()
+    return {
+        "mps": iterations / totalTime,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99)
+    }
+
+
+def measureTask(function, iterations):
+    """
+    call function iterations times, return calls per second and
+    p50/p99 latency in milliseconds
+    """
+    latencies = []
+    startTime = time.time()
+    for _ in range(iterations):
+        callTime = time.time()
+        function()
+        latencies.append((time.time() - callTime) * 1000)
+    totalTime = time.time() - startTime
+
+    latencies.sort()
+    return {
+        "mps": iterations / totalTime,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99)
+    }
+
+
+def runBenchmarks(iterations):
+    """
+    run all benchmarks, return dict of benchmark name -> results
+    """
+    workDir = tempfile.mkdtemp(prefix="innoxmpp-benchmark-")
+    results = {}
+    bots = []
+    try:
+        setUpRepositories(workDir)
+        configFile = writeConfig(workDir)
+        checkStreamManagement(configFile)
+
+        linuxBot = startBot(BenchmarkLinuxBot, configFile)
+        bots.append(linuxBot)
+        gitBot = startBot(BenchmarkGitBot, configFile)
+        bots.append(gitBot)
+
+        results["linux.help"] = measure(linuxBot, "help", iterations)
+        results["linux.uptime"] = measure(linuxBot, "uptime", iterations)
+        results["linux.uptime.cached"] = measure(linuxBot, "uptime",
+            iterations, cached=True)
+        results["linux.invalid"] = measure(linuxBot, "nosuchcommand",
+            iterations)
+        results["linux.diskcheck"] = measureTask(linuxBot.taskCheckFreeSpace,
+            iterations)
+
+        results["git.help"] = measure(gitBot, "help", iterations)
+        results["git.list"] = measure(gitBot, "list", iterations)
+        results["git.branch"] = measure(gitBot, "branch bench", iterations,
+            lambda body: "master" in body or "main" in body)
+        results["git.status"] = measure(gitBot, "status bench", iterations)
+        results["git.branch.cached"] = measure(gitBot, "branch bench",
+            iterations, lambda body: "master" in body or "main" in body,
+            cached=True)
+        results["git.status.cached"] = measure(gitBot, "status bench",
+            iterations, cached=True)
+        # pull runs as a job, wait for the job to finish
+        results["git.pull"] = measure(gitBot, "pull bench",
+            max(1, iterations // 10),
+            lambda body: body.startswith("Finished") or "failed" in body)
+    finally:
+        for bot in bots:
+            bot.shutdown()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return results
+
+
+def compareWithBaseline(results, baseline, tolerance):
+    """
+    return list of regressions compared to baseline
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference == None:
+            continue
+        if result["mps"] < reference["mps"] * (1 - tolerance):
+            regressions.append("%s: %.1f msg/s, baseline %.1f msg/s" %
+                (name, result["mps"], reference["mps"]))
+        for key in ("p50", "p99"):
+            if result[key] > reference[key] * (1 + tolerance):
+                regressions.append("%s: %s %.2fms, baseline %.2fms" %
+                    (name, key, result[key], reference[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200,
+        help="messages sent per benchmark")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+        help="allowed relative deviation from the baseline")
+    parser.add_argument("--save-baseline", action="store_true",
+        help="store the results as new baseline")
+    arguments = parser.parse_args()
+
+    results = runBenchmarks(arguments.iterations)
+
+    print("%-20s %10s %10s %10s" % ("benchmark", "msg/s", "p50 ms", "p99 ms"))
+    for name, result in sorted(results.items()):
+        print("%-20s %10.1f %10.2f %10.2f" % (name, result["mps"],
+            result["p50"], result["p99"]))
+
+    if arguments.save_baseline:
+        with open(BASELINE_FILE, "w") as baselineFile:
+            json.dump(results, baselineFile, indent=2, sort_keys=True)
+        print("Baseline saved to %s" % BASELINE_FILE)
+        return 0
+
+    if not os.path.exists(BASELINE_FILE):
+        print("No baseline found, run with --save-baseline to create one")
+        return 0
+
+    with open(BASELINE_FILE) as baselineFile:
+        baseline = json.load(baselineFile)
+
+    regressions = compareWithBaseline(results, baseline, arguments.tolerance)
+    if len(regressions) > 0:
+        print("\nRegressions:")
+        print("\n".join(regressions))
+        return 1
+
+    print("\nNo regressions compared to the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
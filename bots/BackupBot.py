@@ -7,6 +7,9 @@
 """
 
 from bots.GenericBot import GenericBot
+from framework.CommandRegistry import command
+from framework.LogTailer import LogTailer
+import os
 
 
 class BackupBot(GenericBot):
@@ -20,24 +23,135 @@ class BackupBot(GenericBot):
         self.configoptions.addConfigOption(
             name="logdir",
             value="/tmp",
-            description="directory to track")
+            description="directory to track",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="logfiles",
             value="CHANGEME",
-            description="logfiles to track")
+            description="logfiles to track",
+            optionType="pathlist",
+            needsRestart=True)
 
-    def run(self):
-        super(BackupBot, self).run()
-        self.logger.debug("Tracking backup logging dir %s" % self.logdir)
-        self.logger.debug("Tracking log files %s" % self.logfiles)
+        self.configoptions.addConfigOption(
+            name="statefile",
+            value="",
+            description="file to persist log offsets and backup status in (empty = off)",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="logpollinterval",
+            value=5,
+            description="seconds between two checks of the log files",
+            optionType="float",
+            needsRestart=True)
+
+        # follows the log files, set up in _initializeBot
+        self.logTailer = None
+
+        # names of the tracked log files, the summary of the last backup
+        # per log file is kept in the persisted user data of the tailer
+        self.logNames = []
+
+    def _initializeBot(self):
+        """
+        start following the duplicity log files
+        """
+        super(BackupBot, self)._initializeBot()
+
+        logdir = self.configoptions["logdir"]
+        logfiles = self.configoptions["logfiles"]
+        self.logger.debug("Tracking backup logging dir %s", logdir)
+        self.logger.debug("Tracking log files %s", logfiles)
+
+        paths = [os.path.join(logdir, logfile) for logfile in logfiles]
+        self.logNames = sorted(os.path.basename(path) for path in paths)
+
+        self.logTailer = LogTailer(paths, self._processLogLine,
+            stateFile=self.configoptions["statefile"] or None,
+            pollInterval=self.configoptions["logpollinterval"])
+        if not self.logTailer.start():
+            self.logger.info("inotify not available, polling log files")
+
+    def _shutdownBot(self):
+        """
+        stop following the log files
+        """
+        self.logTailer.stop()
+        super(BackupBot, self)._shutdownBot()
 
+    def _processLogLine(self, path, line):
+        """
+        Update backup status of a log file with a new log line
+        """
+        logName = os.path.basename(path)
+        summary = self.logTailer.userData.setdefault(logName, {})
+
+        fields = line.split(None, 1)
+        if len(fields) == 0:
+            return
+        key = fields[0]
+        value = fields[1].strip() if len(fields) > 1 else ""
+
+        # duplicity backup statistics, e.g. 'EndTime 1349253104.96 (Wed ...)'
+        if key == "StartTime":
+            # a new backup run starts, forget the previous statistics
+            summary.clear()
+            summary["start"] = value
+        elif key in ("EndTime", "ElapsedTime", "TotalDestinationSizeChange"):
+            summary[key] = value
+        elif key == "Errors":
+            summary["errors"] = value
+        elif key == "ERROR" or key.startswith("Error"):
+            summary["lastError"] = line.strip()
+        else:
+            return
+
+        self.logger.debug("Backup event in %s: %s", logName, line)
+
+    def _getStatusText(self, logName):
+        """
+        Return text describing the last backup in a log file
+        """
+        summary = self.logTailer.userData.get(logName)
+        if not summary:
+            return "%s: no backup found" % logName
+
+        if "EndTime" in summary:
+            text = "%s: last backup finished %s, took %s, %s errors" % (
+                logName, summary["EndTime"].split(" ", 1)[-1],
+                summary.get("ElapsedTime", "?").split(" ", 1)[-1],
+                summary.get("errors", "?"))
+            if "TotalDestinationSizeChange" in summary:
+                text += ", size change %s" % \
+                    summary["TotalDestinationSizeChange"].split(" ", 1)[-1]
+        elif "start" in summary:
+            text = "%s: backup running since %s" % (logName,
+                summary["start"].split(" ", 1)[-1])
+        else:
+            text = "%s: no backup statistics found" % logName
+
+        if "lastError" in summary:
+            text += "\nLast error: %s" % summary["lastError"]
+        return text
+
+    @command(maxArgs=1)
     def handleStatusCommand(self, message, arguments):
         """
-        Handler for 'status' command
+        status [<logfile>]
+
+        Show status of the last backup for all (or one) tracked log files
         """
         self.logger.debug("Calling the status command")
-        self.logger.debug(arguments)
+        self.logger.debug("Arguments: %s", arguments)
+
+        logNames = self.logNames
+        if len(arguments) == 1:
+            if arguments[0] not in self.logNames:
+                self.sendMessage(message,
+                    "Log file '%s' is not tracked" % arguments[0])
+                return 1
+            logNames = [arguments[0]]
 
-        # TODO
-        # write command to log file
+        self.sendMessage(message, "\n".join(self._getStatusText(logName)
+            for logName in logNames))
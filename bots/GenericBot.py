@@ -7,16 +7,29 @@
     Copyright (C) 2012 Bjoern Stierand
 """
 
-import logging              # output logging
 import sleekxmpp            # XMPP communication
 import configparser         # parse INI configuration file
 import ssl                  # change SSL handling (for OpenFire servers)
-import subprocess           # run OS commands in a shell
-import os                   # perform OS operations (e.g. chdir)
-import inspect              # introspection (for generic 'help' function)
+import subprocess           # run OS commands
+import os                   # perform OS operations (e.g. path checks)
+import shutil               # resolve binaries of OS commands
 import sys                  # get frame for function introspection
+import time                 # rate limit streamed command output
+import collections          # bounded buffer for streamed command output
+import threading            # per-thread capture of command replies
 
+from framework.AlertManager import AlertManager
+from framework.CommandCache import CommandCache, ReplyCapture
+from framework.CommandRegistry import CommandRegistry, command, splitCommands
 from framework.ConfigOptions import ConfigOptions
+from framework.JobManager import JobManager
+from framework.LogManager import LogManager
+from framework.Metrics import DEFAULT_BUCKETS, Metrics
+from framework.MessageQueue import MessageQueue
+from framework.ResultCache import ResultCache, splitIntoPages
+from framework.RosterStore import RosterStore
+from framework.SessionStore import SessionStore
+from framework.TaskScheduler import TaskScheduler
 
 
 class GenericBot(sleekxmpp.ClientXMPP):
@@ -34,43 +47,328 @@ class GenericBot(sleekxmpp.ClientXMPP):
         self.configoptions.addConfigOption(
             name="config",
             value="config/innoxmpp.ini",
-            description="config file to load values from")
+            description="config file to load values from",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="jid",
             value="CHANGEME",
-            description="XMPP ID for the bot user")
+            description="XMPP ID for the bot user",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="password",
             value="CHANGEME",
-            description="XMPP password for the bot user")
+            description="XMPP password for the bot user",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="openfire",
             value=1,
-            description="Does the target XMPP server run OpenFire?")
+            description="Does the target XMPP server run OpenFire?",
+            optionType="bool",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="streammanagement",
+            value=True,
+            description="resume the XMPP stream after short disconnects (XEP-0198)",
+            optionType="bool",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="rosterfile",
+            value="",
+            description="file to keep a copy of the roster in (empty = off)",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="reconnectmaxdelay",
+            value=300,
+            description="max. seconds between two reconnect attempts",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="rooms",
+            value="",
+            description="multi-user chat rooms to join, alerts are sent there instead of to single JIDs",
+            optionType="list",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="roomnick",
+            value=self.__class__.__name__,
+            description="nickname of the bot in the rooms, commands in a room have to start with it",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="loglevel",
-            value=logging.DEBUG,
-            description="Default loglevel")
+            value="INFO",
+            description="loglevel of the bot (e.g. DEBUG, INFO, WARNING)",
+            optionType="enum",
+            choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+
+        self.configoptions.addConfigOption(
+            name="logfile",
+            value="",
+            description="file to write the log of the bot to (empty = stderr)")
+
+        self.configoptions.addConfigOption(
+            name="logmaxbytes",
+            value=10485760,
+            description="max. size of the log file before it is rotated",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="logbackups",
+            value=5,
+            description="number of rotated log files to keep",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="workers",
+            value=4,
+            description="number of shell commands that may run in parallel",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="streaminterval",
+            value=5,
+            description="min. seconds between two messages of streamed output",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="streamlines",
+            value=10,
+            description="max. number of lines per message of streamed output",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="sendwindow",
+            value=0.5,
+            description="seconds to wait for messages to the same recipient to merge",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="sendrate",
+            value=1.0,
+            description="max. messages per second to a single recipient",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="sendburst",
+            value=5,
+            description="max. burst of messages to a single recipient",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="sendglobalrate",
+            value=10.0,
+            description="max. messages per second to all recipients",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="sendglobalburst",
+            value=20,
+            description="max. burst of messages to all recipients",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="pagesize",
+            value=3000,
+            description="max. characters per message, longer results are paginated",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="resultcachesize",
+            value=1048576,
+            description="max. characters kept for paginated results of all users",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="commandcachesize",
+            value=256,
+            description="max. number of cached replies of read-only commands",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="sessions",
+            value=1000,
+            description="max. number of senders whose session state is kept",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="sessionidle",
+            value=86400,
+            description="seconds after which the session state of an idle sender is dropped",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="sessionfile",
+            value="",
+            description="file to persist session state in (empty = off)",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="taskworkers",
+            value=2,
+            description="number of scheduled tasks that may run in parallel",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="taskjitter",
+            value=5.0,
+            description="max. random seconds added to every scheduled task run",
+            optionType="float",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="metricsfile",
+            value="",
+            description="file to write metrics to in Prometheus text format (empty = off)")
+
+        self.configoptions.addConfigOption(
+            name="metricsinterval",
+            value=60,
+            description="seconds between two writes of the metrics file",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="alertrepeat",
+            value=300,
+            description="seconds until an active alert is sent again",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="alertbackoff",
+            value=2.0,
+            description="factor the time between repeated alerts grows with",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="alertmaxrepeat",
+            value=86400,
+            description="max. seconds between two repeated alerts",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="alertstatefile",
+            value="",
+            description="file to persist alert states in (empty = off)",
+            needsRestart=True)
+
+        # asynchronous job engine and outbound message queue,
+        # set up in run() once the config is read
+        self.jobManager = None
+        self.messageQueue = None
+        self.resultCache = None
+        self.sessionStore = None
+        self.commandCache = None
+        self.alertManager = None
+        self.scheduler = None
+        self.rosterStore = None
+
+        # bare JIDs of the multi-user chat rooms the bot is in
+        self.rooms = frozenset()
 
-    def _cacheJIDs(self):
+        # absolute paths of the binaries run by the bot, resolved once
+        self.binaries = {}
+
+        # environment of child processes, the C locale keeps their output
+        # parseable and git must never wait for credentials on a terminal
+        self.commandEnvironment = dict(os.environ, LC_ALL="C",
+            GIT_TERMINAL_PROMPT="0")
+
+        # counters and latency histograms, exposed by the 'stats' command
+        self.metrics = Metrics(constLabels={"bot": self.__class__.__name__})
+
+        # command handlers are collected once per bot class, this also
+        # validates them on startup; dispatching is a dict lookup afterwards
+        self.commandRegistry = CommandRegistry.forClass(self.__class__)
+        self.commandHandlers = self.commandRegistry.bind(self)
+
+        # replies of the command running in the current thread, collected
+        # while a cacheable command or a batch of commands is handled
+        self.commandCapture = threading.local()
+
+    def _updateTargetJIDs(self, event=None):
         """
-        Cache client JIDs from roster
+        Rebuild target JIDs from roster
         These are going to be used to send push messages to
 
-        Runs only once 5 secs after startup
+        Called whenever the roster changes
         """
-
+        targetJIDs = set()
         # get all target JIDs from roster for JID of bot
-        for targetJID in list(self.roster[self.boundjid.bare]):
+        for targetJID in list(self.client_roster):
             # prevent to put the bot itself in the target list
             # as we don't want to create an endless cycle of
             # sending messages FROM the bot TO the bot
-            if targetJID != self.boundjid.bare:
-                self.targetJIDs.append(targetJID)
+            if targetJID != self.boundjid.bare and \
+                    self.client_roster[targetJID]["subscription"] != "remove":
+                targetJIDs.add(targetJID)
+        self.targetJIDs = targetJIDs
+
+    # the JID sets are replaced instead of modified in place, so other
+    # threads (e.g. scheduled tasks sending alerts) can always read them
+
+    def _handleSubscribed(self, presence):
+        """
+        Add contact to the target JIDs once the subscription is in place
+        """
+        bareJID = presence["from"].bare
+        if bareJID != self.boundjid.bare:
+            self.targetJIDs = self.targetJIDs | set([bareJID])
+
+    def _handleUnsubscribed(self, presence):
+        """
+        Remove contact from the target JIDs
+        """
+        bareJID = presence["from"].bare
+        self.targetJIDs = self.targetJIDs - set([bareJID])
+        self.availableJIDs = self.availableJIDs - set([bareJID])
+
+    def _handleAvailable(self, presence):
+        """
+        Track contacts which are online
+        """
+        # occupants of the rooms are no contacts
+        if presence["from"].bare in self.rooms:
+            return
+        self.availableJIDs = self.availableJIDs | set([presence["from"].bare])
+
+    def _handleUnavailable(self, presence):
+        """
+        Track contacts which went offline (with their last resource)
+        """
+        bareJID = presence["from"].bare
+        if bareJID in self.rooms:
+            return
+        # indexing the roster would add an item for unknown JIDs
+        if bareJID not in self.client_roster or \
+                len(self.client_roster[bareJID].resources) == 0:
+            self.availableJIDs = self.availableJIDs - set([bareJID])
+
+    def _initializeBot(self):
+        """
+        Put bot specific setup here, called after the config was read
+
+        To be overwritten in concrete bot implementations
+        """
+        pass
+
+    def _shutdownBot(self):
+        """
+        Put bot specific cleanup here, called after the connection was closed
+
+        To be overwritten in concrete bot implementations
+        """
+        pass
 
     def _scheduleTasks(self):
         """
@@ -79,11 +377,36 @@ class GenericBot(sleekxmpp.ClientXMPP):
         To be overwritten in concrete bot implementations
         """
 
-        # schedule caching of target JIDs
-        def cacheJIDs():
-            self._cacheJIDs()
+        # write metrics for the Prometheus node exporter
+        def writeMetrics():
+            self.metrics.writePrometheusFile(self.configoptions["metricsfile"])
+
+        if self.configoptions["metricsfile"] != "":
+            self.addTask("Write metrics",
+                self.configoptions["metricsinterval"], writeMetrics)
+
+        # drop state of idle senders
+        def expireSessions():
+            self.sessionStore.expire()
+            self.sessionStore.saveState()
 
-        self.schedule("Cache JIDs", 5, cacheJIDs)
+        self.addTask("Expire sessions", 300, expireSessions)
+
+        # write changes of the roster copy
+        if self.rosterStore != None:
+            self.addTask("Save roster", 60, self.rosterStore.flush)
+
+    def addTask(self, name, interval, function, repeat=True):
+        """
+        Add task to the scheduler, it runs every interval seconds in the
+        task worker pool (or once if repeat is False)
+        """
+        def runTask():
+            with self.metrics.timer("task_duration_seconds", {"task": name}):
+                function()
+
+        return self.scheduler.addTask(name, interval, runTask, repeat,
+            owner=self.__class__.__name__)
 
     def start(self, event):
         """
@@ -95,48 +418,236 @@ class GenericBot(sleekxmpp.ClientXMPP):
         # although we don't necessarily need to get the roster
         # the spec forces us to get it, otherwise some servers may not deliver
         # or send messages to us (ejabberd doesn't care)
-        try:
-            self.get_roster()
-        except sleekxmpp.IQTimeout:
-            self.logger.info("Timeout while getting roster")
-            # TODO: handle further timeout issues
-        except sleekxmpp.IQError:
-            self.logger.info("Bad data received while retrieving roster")
-            # TODO: handle further error issues
+        # the copy from disk is used right away, with roster versioning the
+        # server only sends the changes, so don't wait for the answer
+        self._updateTargetJIDs()
+        self.get_roster(block=False, callback=self._handleRosterResult)
+
+        # send messages held back while disconnected
+        self.messageQueue.resume()
 
-        # TODO: roster data is saved in self.roster/self.client_roster
-        # maybe use this data as base for push messages
+        # join the rooms (again after a reconnect), without their history
+        # so old messages aren't taken as commands
+        for room in sorted(self.rooms):
+            self.logger.info("Joining room %s as %s", room,
+                self.configoptions["roomnick"])
+            self.plugin["xep_0045"].joinMUC(room,
+                self.configoptions["roomnick"], maxhistory="0", wait=False)
 
-    def executeShellCommand(self, command,  targetDir=None):
+    def _handleRosterResult(self, iq):
         """
-        Execute command on the shell using subprocess
+        Log failed roster requests, the cached roster stays in use
         """
-        # change to target dir if path was given
-        if targetDir != None:
-            os.chdir(targetDir)
+        if iq["type"] == "error":
+            self.logger.info("Retrieving roster failed: %s",
+                iq["error"]["condition"])
 
-        # try to execute the command
+    def _handleSessionResumed(self, event=None):
+        """
+        The stream was resumed (XEP-0198), the server keeps presence and
+        roster, unacknowledged stanzas are sent again by SleekXMPP
+        """
+        self.logger.info("Session resumed")
+        self.messageQueue.resume()
+
+    def _handleDisconnected(self, event=None):
+        """
+        Hold outgoing messages back until the session is up again
+        """
+        self.messageQueue.pause()
+
+    def resolveBinary(self, name):
+        """
+        Return absolute path of binary name (looked up in PATH once),
+        None if it doesn't exist
+
+        Bots should resolve their binaries in _initializeBot, so missing
+        ones are reported on startup
+        """
+        path = self.binaries.get(name)
+        if path == None:
+            path = shutil.which(name)
+            if path == None:
+                self.logger.error("Command '%s' not found in PATH", name)
+                return None
+            self.binaries[name] = path
+        return path
+
+    def _spawnProcess(self, argv, targetDir=None, job=None):
+        """
+        Start command given as argument list (binary and arguments, no
+        shell is involved), its output (stdout and stderr) can be read
+        from process.stdout
+
+        Returns None if the process couldn't be started
+        """
+        binary = argv[0]
+        if not os.path.isabs(binary):
+            binary = self.resolveBinary(binary)
+            if binary == None:
+                self.metrics.increment("subprocess_errors_total")
+                return None
+
+        startTime = time.time()
         try:
-            result = subprocess.check_output(command,
-                        shell=True,                 # run in a subshell
-                        universal_newlines=True,    # always return text
+            process = subprocess.Popen([binary] + list(argv[1:]),
+                        cwd=targetDir,              # run in target dir
+                        env=self.commandEnvironment,
+                        universal_newlines=True,    # text, '\r' ends a line
+                        stdin=subprocess.DEVNULL,   # never wait for input
+                        stdout=subprocess.PIPE,
                         stderr=subprocess.STDOUT    # redirect stderr to stdout
                         )
-        except subprocess.CalledProcessError as e:
-            result = "Error: %s" % e.output
-            self.logger.debug(
-                "Error occurred: Code: %s, Text: %s" % (e.returncode, e.output))
-            return e.returncode, ""
+        except OSError as e:
+            self.logger.debug("Error occurred: %s", e)
+            self.metrics.increment("subprocess_errors_total")
+            return None
+        self.metrics.observe("subprocess_spawn_seconds", time.time() - startTime)
+
+        # terminated right away if the job got cancelled while the
+        # process was spawned
+        if job != None:
+            job.addProcess(process)
+
+        return process
+
+    def executeCommand(self, argv, targetDir=None, job=None):
+        """
+        Execute command given as argument list using subprocess
+
+        The command runs in targetDir (without changing the working directory
+        of the bot process). If a job is passed, the child process is
+        registered with it so the job can be cancelled.
+        """
+        startTime = time.time()
+
+        # try to execute the command
+        process = self._spawnProcess(argv, targetDir, job)
+        if process == None:
+            return 1, ""
+
+        result = process.communicate()[0]
+        if job != None:
+            job.removeProcess(process)
+        self.metrics.observe("subprocess_duration_seconds",
+            time.time() - startTime)
+
+        if process.returncode != 0:
+            self.logger.debug("Error occurred: Code: %s, Text: %s",
+                process.returncode, result)
+            return process.returncode, ""
 
         return 0, result
 
-    def getCommandHandlerName(self, command):
+    def executeCommandStreaming(self, sender, argv, targetDir=None,
+            job=None):
+        """
+        Execute command given as argument list and forward its output to
+        the sender while it is running
+
+        Output lines are collected and sent at most every 'streaminterval'
+        seconds. Only the last 'streamlines' lines are kept between two
+        messages, so the output is never held in memory as a whole.
+        Returns the return code and an empty result.
+        """
+        interval = self.configoptions["streaminterval"]
+        maxLines = self.configoptions["streamlines"]
+        startTime = time.time()
+
+        process = self._spawnProcess(argv, targetDir, job)
+        if process == None:
+            return 1, ""
+
+        lines = collections.deque(maxlen=maxLines)
+        skippedLines = 0
+        lastSent = time.time()
+
+        def flush():
+            text = "\n".join(lines)
+            if skippedLines > 0:
+                text = "[%d lines skipped]\n%s" % (skippedLines, text)
+            self.sendMessage(sender, text)
+            lines.clear()
+
+        for line in process.stdout:
+            line = line.rstrip()
+            if line == "":
+                continue
+            if len(lines) == maxLines:
+                skippedLines += 1
+            lines.append(line)
+
+            if time.time() - lastSent >= interval:
+                flush()
+                skippedLines = 0
+                lastSent = time.time()
+
+        process.wait()
+        if job != None:
+            job.removeProcess(process)
+        self.metrics.observe("subprocess_duration_seconds",
+            time.time() - startTime)
+
+        # send what is left over
+        if len(lines) > 0:
+            flush()
+
+        if process.returncode != 0:
+            self.logger.debug("Error occurred: Code: %s", process.returncode)
+
+        return process.returncode, ""
+
+    def executeCommandAsync(self, sender, argv, targetDir=None,
+            callback=None, description=None, stream=False, lock=None):
         """
-        Get command handler name for passed command
+        Execute command given as argument list as a job in the worker pool
+
+        Returns the job ID right away. When the command has finished,
+        callback(returnCode, result) is called, by default the result is
+        sent to the sender. If stream is set, the output is forwarded to
+        the sender while the command runs and the result is empty. If a
+        lock is passed, it is held while the command runs. Within a batch
+        of commands the job runs inline and returns when it has finished.
         """
-        commandHandlerName = 'handle' + command.capitalize() + 'Command'
-        self.logger.debug("COMMAND HANDLER NAME: %s" % commandHandlerName)
-        return commandHandlerName
+        if description == None:
+            description = " ".join(argv)
+
+        if callback == None:
+            def callback(returnCode, result):
+                if returnCode == 0:
+                    if result != "":
+                        self.sendMessage(sender, result)
+                    else:
+                        self.sendMessage(sender, "Finished %s" % description)
+                else:
+                    self.sendMessage(sender, "Command failed! Error %s" %
+                        returnCode)
+
+        def runCommand(job):
+            if lock != None:
+                with lock:
+                    return execute(job)
+            return execute(job)
+
+        def execute(job):
+            if stream:
+                return self.executeCommandStreaming(sender, argv,
+                    targetDir, job)
+            return self.executeCommand(argv, targetDir, job)
+
+        def jobFinished(job, result):
+            returnCode, output = result
+            if returnCode != 0:
+                self._flagCommandFailure()
+            callback(returnCode, output)
+
+        inline = self._isBatchRunning()
+        jobID = self.jobManager.submit(description, sender, runCommand,
+            jobFinished, owner=self.__class__.__name__, inline=inline,
+            errorCallback=self._jobFailed)
+        if not inline:
+            self.sendMessage(sender, "Started job %d: %s" % (jobID, description))
+        return jobID
 
     def _getDocForCurrentFunction(self):
         """
@@ -146,38 +657,118 @@ class GenericBot(sleekxmpp.ClientXMPP):
         # taken from http://code.activestate.com/recipes/66062/
         callerName = sys._getframe(1).f_code.co_name
 
-        # find matching member object
-        # somehow getmembers supports a predicate, but I honestly don't
-        # know how it works, so I use iteration for now
-        memberObjects = inspect.getmembers(self, inspect.ismethod)
-        for objectName, objectRef in memberObjects:
-            # check if we have found the function we want
-            if objectName == callerName:
-                # return stripped docstring for function reference
-                return inspect.getdoc(objectRef)
+        # the docstrings of all command handlers are kept in the registry
+        commandEntry = self.commandRegistry.getByHandlerName(callerName)
+        if commandEntry != None:
+            return commandEntry.doc
 
-    def run(self):
+    def loadConfig(self):
         """
-        Startup the bot instance
-        Connect to the XMPP server and start processing XMPP stanzas.
+        Read parameters from the config file and set up logging
         """
         # get paramters from config file
         if os.path.exists(self.configoptions["config"]):
             config = configparser.RawConfigParser()
             config.read(self.configoptions["config"])
-            self.configoptions.parseConfig(self.__class__.__name__, config)
+            try:
+                warnings = self.configoptions.parseConfig(
+                    self.__class__.__name__, config)
+            except ValueError as e:
+                sys.stderr.write("Invalid config file provided:\n%s\n" % e)
+                sys.exit(2)
         else:
             sys.stderr.write("Invalid config file provided!\n")
             sys.exit(2)
 
-        # set loglevel
-        logging.basicConfig(level=self.configoptions["loglevel"],
-            format='%(levelname)-8s %(filename)s:%(funcName)s(%(lineno)d) %(message)s')
+        self._setUpLogging()
+
+        for warning in warnings:
+            self.logger.warning("%s", warning)
+
+    def _setUpLogging(self):
+        """
+        Set up logger of the bot, records are written in the background
+        so logging never blocks message handling
+        """
+        self.logger = LogManager.setUp("innoxmpp.%s" % self.__class__.__name__,
+            level=self.configoptions["loglevel"],
+            logFile=self.configoptions["logfile"],
+            maxBytes=self.configoptions["logmaxbytes"],
+            backupCount=self.configoptions["logbackups"])
+
+    def reloadConfig(self):
+        """
+        Read the config file again and apply the changes while the bot
+        stays connected
+
+        Options which need a restart keep their current value. Returns
+        a list of lines describing the result.
+        """
+        config = configparser.RawConfigParser()
+        if len(config.read(self.configoptions["config"])) == 0:
+            return ["Unable to read config file %s" % self.configoptions["config"]]
+
+        oldValues = self.configoptions.getValues()
+        try:
+            warnings = self.configoptions.parseConfig(self.__class__.__name__,
+                config)
+        except ValueError as e:
+            return ["Config not reloaded:", str(e)]
+        newValues = self.configoptions.getValues()
+
+        changed = sorted(name for name in newValues
+            if newValues[name] != oldValues[name])
+        restart = [name for name in changed
+            if self.configoptions.needsRestart(name)]
+        for name in restart:
+            self.configoptions[name] = oldValues[name]
 
-        # get current logger
-        self.logger = logging.getLogger()
+        # apply the new values to the running services
+        self._setUpLogging()
+        self.messageQueue.configure(
+            window=self.configoptions["sendwindow"],
+            rate=self.configoptions["sendrate"],
+            burst=self.configoptions["sendburst"],
+            globalRate=self.configoptions["sendglobalrate"],
+            globalBurst=self.configoptions["sendglobalburst"],
+            maxLength=self.configoptions["pagesize"])
+        self.alertManager.repeatInterval = self.configoptions["alertrepeat"]
+        self.alertManager.backoffFactor = self.configoptions["alertbackoff"]
+        self.alertManager.maxRepeatInterval = self.configoptions["alertmaxrepeat"]
+        self.reconnect_max_delay = self.configoptions["reconnectmaxdelay"]
+        self.sessionStore.idleTimeout = self.configoptions["sessionidle"]
 
-        if self.configoptions["openfire"] != "0":
+        # tasks are scheduled again with the new intervals
+        if len(changed) > len(restart):
+            self.scheduler.removeTasks(self.__class__.__name__)
+            self._scheduleTasks()
+
+        lines = list(warnings)
+        applied = [name for name in changed if name not in restart]
+        if len(applied) > 0:
+            lines.append("Config reloaded, changed: %s" % ", ".join(applied))
+        else:
+            lines.append("Config reloaded, nothing changed")
+        if len(restart) > 0:
+            lines.append("Changes need a restart: %s" % ", ".join(restart))
+
+        for line in lines:
+            self.logger.info("%s", line)
+        return lines
+
+    def run(self, block=True, jobManager=None, scheduler=None):
+        """
+        Startup the bot instance
+        Connect to the XMPP server and start processing XMPP stanzas.
+
+        jobManager/scheduler - shared by several bots running in one
+        process, the bot creates its own if they are not passed. If
+        block is False, run() returns once the bot is connected and
+        shutdown() has to be called when the bot is stopped.
+        """
+        self.loadConfig()
+
+        if self.configoptions["openfire"]:
             self.logger.debug("Running bot in OpenFire mode")
             self.ssl_version = ssl.PROTOCOL_SSLv3
 
@@ -185,114 +776,695 @@ class GenericBot(sleekxmpp.ClientXMPP):
         super(GenericBot, self).__init__(self.configoptions["jid"],
             self.configoptions["password"])
 
+        # resume the stream after short disconnects, unacknowledged
+        # stanzas are sent again after the resumption (XEP-0198)
+        if self.configoptions["streammanagement"]:
+            self.register_plugin("xep_0198")
+
+        # the delay between reconnect attempts doubles (with some random
+        # jitter added by SleekXMPP) up to this limit
+        self.reconnect_max_delay = self.configoptions["reconnectmaxdelay"]
+
+        # keep roster and roster version on disk
+        if self.configoptions["rosterfile"] != "":
+            self.rosterStore = RosterStore(self.configoptions["rosterfile"])
+            self.roster.set_backend(self.rosterStore, save=False)
+
+        # multi-user chat support
+        self.register_plugin("xep_0045")
+        self.rooms = frozenset(sleekxmpp.jid.JID(room).bare
+            for room in self.configoptions["rooms"])
+
         # setup callbacks
 
         # handle server connection establishment
         self.add_event_handler("session_start", self.start)
+        self.add_event_handler("session_resumed", self._handleSessionResumed)
+        self.add_event_handler("disconnected", self._handleDisconnected)
 
         # handle received message
         self.add_event_handler("message", self.handleMessage)
 
+        # keep target JIDs in sync with roster and presence changes
+        self.add_event_handler("roster_update", self._updateTargetJIDs)
+        self.add_event_handler("presence_subscribed", self._handleSubscribed)
+        self.add_event_handler("presence_unsubscribed", self._handleUnsubscribed)
+        self.add_event_handler("presence_unsubscribe", self._handleUnsubscribed)
+        self.add_event_handler("presence_available", self._handleAvailable)
+        self.add_event_handler("presence_unavailable", self._handleUnavailable)
+
         # registered JIDs for this client (i.e. the JIDs to
-        # send monitoring messages to)
-        self.targetJIDs = []
+        # send monitoring messages to) and the ones currently online
+        self.targetJIDs = set()
+        self.availableJIDs = set()
+
+        # set up worker pool for asynchronous jobs
+        self.ownsJobManager = jobManager == None
+        if self.ownsJobManager:
+            jobManager = JobManager(self.configoptions["workers"])
+        self.jobManager = jobManager
+        self.metrics.setGauge("jobs",
+            lambda: len(self.jobManager.getJobs(self.__class__.__name__)))
+
+        # set up outbound message queue
+        self.messageQueue = MessageQueue(self._sendQueuedMessage,
+            window=self.configoptions["sendwindow"],
+            rate=self.configoptions["sendrate"],
+            burst=self.configoptions["sendburst"],
+            globalRate=self.configoptions["sendglobalrate"],
+            globalBurst=self.configoptions["sendglobalburst"],
+            maxLength=self.configoptions["pagesize"])
+        self.messageQueue.start()
+        self.metrics.setGauge("message_queue_depth", self.messageQueue.depth)
+
+        # set up cache for the remaining pages of long results
+        self.resultCache = ResultCache(self.configoptions["resultcachesize"])
+        self.metrics.setGauge("result_cache_size",
+            lambda: self.resultCache.size)
+
+        # set up state per sender (e.g. the page of a long result)
+        self.sessionStore = SessionStore(
+            maxSessions=self.configoptions["sessions"],
+            idleTimeout=self.configoptions["sessionidle"],
+            stateFile=self.configoptions["sessionfile"] or None)
+        self.sessionStore.loadState()
+        self.metrics.setGauge("sessions", lambda: len(self.sessionStore))
+
+        # set up cache for the replies of read-only commands
+        self.commandCache = CommandCache(self.configoptions["commandcachesize"])
+        self.metrics.setGauge("command_cache_entries",
+            lambda: len(self.commandCache))
+
+        # set up alert handling, active alerts survive a restart
+        self.alertManager = AlertManager(self._sendAlert,
+            stateFile=self.configoptions["alertstatefile"],
+            repeatInterval=self.configoptions["alertrepeat"],
+            backoffFactor=self.configoptions["alertbackoff"],
+            maxRepeatInterval=self.configoptions["alertmaxrepeat"])
+        self.alertManager.loadState()
+
+        # set up scheduler, tasks run in a worker pool and not on the
+        # event thread
+        self.ownsScheduler = scheduler == None
+        if self.ownsScheduler:
+            scheduler = TaskScheduler(
+                maxWorkers=self.configoptions["taskworkers"],
+                jitter=self.configoptions["taskjitter"],
+                logger=self.logger)
+        self.scheduler = scheduler
+
+        # bot specific setup
+        self._initializeBot()
 
         # schedule tasks
         self._scheduleTasks()
+        if self.ownsScheduler:
+            self.scheduler.start()
 
         if self.connect():
-            self.process(block=True)
             self.logger.info("Connection established.")
+            self.process(block=block)
+            if not block:
+                return True
         else:
             self.logger.error("Unable to connect.")
 
+        self.shutdown()
+        return False
+
+    def shutdown(self):
+        """
+        Stop background processing of the bot
+        """
+        self.scheduler.removeTasks(self.__class__.__name__)
+        if self.ownsScheduler:
+            self.scheduler.stop()
+        self._shutdownBot()
+        if self.rosterStore != None:
+            self.rosterStore.flush()
+        self.sessionStore.saveState()
+        if self.ownsJobManager:
+            self.jobManager.shutdown()
+        else:
+            for job in self.jobManager.getJobs(self.__class__.__name__):
+                self.jobManager.cancel(job.jobID)
+        self.messageQueue.stop()
+
+    def getSession(self, sender):
+        """
+        Return session state of sender (by bare JID), e.g. to keep
+        settings of an operator between commands
+        """
+        if isinstance(sender, sleekxmpp.jid.JID):
+            return self.sessionStore.get(sender.bare)
+        return self.sessionStore.get(sleekxmpp.jid.JID(sender).bare)
+
+    def updateAlert(self, key, value, thresholds, message):
+        """
+        Update alert key with the current value
+
+        The alert manager decides whether a notification is sent to the
+        target JIDs (raised, repeated with backoff, or recovered)
+        """
+        return self.alertManager.update(key, value, thresholds, message)
+
+    def retainAlerts(self, keys):
+        """
+        Forget active alerts whose key is not in keys, e.g. of resources
+        removed from the config
+        """
+        self.alertManager.retain(set(keys))
+
+    def _sendAlert(self, key, state, message, recovered):
+        """
+        Send alert notification to the rooms (or all target JIDs)
+        """
+        if recovered:
+            text = "[RECOVERED] %s" % message
+        else:
+            text = "[%s] %s" % (state, message)
+        self.broadcastMessage(text)
+
+    def broadcastMessage(self, text, onlineOnly=True):
+        """
+        Send message to all target JIDs, only to the ones currently
+        online unless onlineOnly is False
+
+        If the bot is in rooms, the message is sent once per room and
+        the server delivers it to the occupants
+        """
+        if len(self.rooms) > 0:
+            self.sendMessage(sorted(self.rooms), text)
+            return
+
+        recipients = self.targetJIDs
+        if onlineOnly:
+            recipients = recipients & self.availableJIDs
+        self.sendMessage(sorted(recipients), text)
+
     def printDebugMessage(self, recipient, text):
         """
         Handle debug message (send to sender and print on stdout)
         """
-        self.logger.debug(text)
+        self.logger.debug("%s", text)
         self.sendMessage(recipient, text)
 
-    def sendMessage(self, recipient, text):
+    def sendMessage(self, recipient, text, paginate=True):
         """
         Send message with given text to recipient(s)
+
+        Messages are put into the outbound queue, which merges messages
+        to the same recipient and applies the rate limits. paginate is
+        False for pages of a result which are already split up.
         """
         # recipient is JID - only one recipient passed
         if isinstance(recipient, sleekxmpp.jid.JID):
-            self.logger.debug("Send message '%s' to '%s'" % (text, recipient))
-            self.send_message(mto=recipient, mbody=text)
+            # keep reply of a cacheable command or a batch
+            capture = getattr(self.commandCapture, "capture", None)
+            while capture != None and capture.recipient == recipient:
+                capture.replies.append(text)
+                if capture.hold:
+                    return
+                capture = capture.parent
+
+            pageSize = self.configoptions["pagesize"]
+            if paginate and len(text) > pageSize:
+                # deliver first page, keep the others for 'more'/'page'
+                pages = splitIntoPages(text, pageSize)
+                self.resultCache.put(recipient.bare, pages)
+                self.getSession(recipient).set("pageCursor", 0)
+                text = self._formatPage(pages, 0)
+            self.messageQueue.put(recipient, text)
 
         # recipient is array - multiple recipients passed
         elif isinstance(recipient, list):
             for item in recipient:
-                self.logger.debug("Send message '%s' to '%s'" % (text, item))
-                self.send_message(mto=item, mbody=text)
+                self.messageQueue.put(item, text)
+
+    def _formatPage(self, pages, index):
+        """
+        Return page with given index plus navigation footer
+        """
+        footer = "[page %d/%d" % (index + 1, len(pages))
+        if index + 1 < len(pages):
+            footer += ", send 'more' for the next page"
+        return "%s\n%s]" % (pages[index], footer)
+
+    def _sendPage(self, sender, index):
+        """
+        Send page with given index of the cached result of sender
+        """
+        result = self.resultCache.get(sender.bare)
+        if result == None:
+            self.sendMessage(sender, "No paginated result available")
+            return 1
+
+        if index < 0 or index >= len(result.pages):
+            self.sendMessage(sender, "Invalid page, result has %d pages" %
+                len(result.pages))
+            return 1
+
+        self.getSession(sender).set("pageCursor", index)
+        self.sendMessage(sender, self._formatPage(result.pages, index),
+            paginate=False)
+
+    def _sendQueuedMessage(self, recipient, text):
+        """
+        Send message from the outbound queue to the XMPP server
+        """
+        self.logger.debug("Send message '%s' to '%s'", text, recipient)
+        if sleekxmpp.jid.JID(recipient).bare in self.rooms:
+            self.send_message(mto=recipient, mbody=text, mtype="groupchat")
+        else:
+            self.send_message(mto=recipient, mbody=text)
+        self.metrics.increment("messages_sent_total")
 
     def handleMessage(self, message):
         """
         Process incoming messages
         """
         if message['type'] in ('chat', 'normal', 'groupchat'):
-            # TODO: handle groupchat messages (do I need special handling here)
-
             # extract message body
             messageBody = message['body']
             self.logger.debug('MESSAGE BODY: %s', messageBody)
 
-            # get command and arguments from message
-            messageParts = messageBody.split()
-            command = messageParts[0]
-
             sender = message['from']
-            self.logger.debug('MESSAGE FROM: %s' % sender)
+            self.logger.debug('MESSAGE FROM: %s', sender)
 
-            arguments = []
-            if len(messageParts) > 0:
-                arguments = messageParts[1:]
-            self.logger.debug('COMMAND: %s', command)
-            self.logger.debug('ARGUMENTS: %s', arguments)
+            if message['type'] == 'groupchat':
+                # only answer commands addressed to the bot, the reply
+                # goes to the room
+                messageBody = self._getRoomCommand(sender, messageBody)
+                if messageBody == None:
+                    return
+                sender = sleekxmpp.jid.JID(sender.bare)
 
-            # check if the command is valid at akk
-            commandHandlerName = self.getCommandHandlerName(command)
-            # try to get command handler using reflection
-            try:
-                commandHandler = getattr(self, commandHandlerName)
-            except AttributeError:
-                self.logger.info(
-                    "Invalid command called, no handler found: %s" % command)
-                commandHandler = None
-
-            if not commandHandler:
-                # return error if no command handler (and thus no
-                # matching command) exists
-                self.sendMessage(sender, "Invalid command '%s' sent!" % command)
-            else:
-                # execute command handler if found
-                self.logger.debug("Valid command %s found, processing" % command)
-                commandHandler(sender, arguments)
+            # several commands can be sent in one message, separated
+            # by newlines or '&&'
+            commands = splitCommands(messageBody)
+            if len(commands) == 1:
+                self._handleCommand(sender, commands[0])
+            elif len(commands) > 1:
+                self._runBatch(sender, commands)
+
+    def _getRoomCommand(self, sender, text):
+        """
+        Return command of a room message addressed to the bot
+        ('<nick>: <command>', '<nick>, <command>' or '@<nick> <command>'),
+        None if the message is for someone else or from the bot itself
+        """
+        nick = self.configoptions["roomnick"]
+        if sender.bare not in self.rooms or sender.resource == nick:
+            return None
+
+        text = text.strip()
+        if text.startswith("@"):
+            text = text[1:]
+        if text.lower().startswith(nick.lower()):
+            rest = text[len(nick):]
+            if rest[:1] in (":", ",", " "):
+                return rest[1:].strip()
+        return None
+
+    def _handleCommand(self, sender, text):
+        """
+        Look up the command in text and call its handler
+
+        Returns False if the command is invalid or failed
+        """
+        # get command and arguments from message
+        messageParts = text.split()
+        command = messageParts[0]
+        arguments = messageParts[1:]
+        self.logger.debug('COMMAND: %s', command)
+        self.logger.debug('ARGUMENTS: %s', arguments)
+
+        # check if the command is valid at all
+        commandEntry = self.commandRegistry.lookup(command)
+
+        if commandEntry == None:
+            # return error if no command handler (and thus no
+            # matching command) exists
+            self.logger.info(
+                "Invalid command called, no handler found: %s", command)
+            self.sendMessage(sender, "Invalid command '%s' sent!" % command)
+            return False
+        elif not commandEntry.acceptsArguments(arguments):
+            # wrong number of arguments, send usage
+            self.sendMessage(sender, "Usage: %s" % commandEntry.usage)
+            return False
+
+        # execute command handler if found
+        self.logger.debug("Valid command %s found, processing", command)
+        return not self._dispatchCommand(commandEntry, sender, arguments)
+
+    def _runBatch(self, sender, commands):
+        """
+        Run several commands of one message in order as a single job,
+        stop at the first failing command and send all replies as one
+        message
+
+        Jobs started by the commands run inline, so a command only
+        starts when the previous one has finished
+        """
+        def runBatch(job):
+            lines = []
+            for index, text in enumerate(commands):
+                if job.cancelled:
+                    break
+
+                # replies are held back and sent as one message
+                commandCapture = ReplyCapture(sender, hold=True)
+                self.commandCapture.capture = commandCapture
+                try:
+                    succeeded = self._handleCommand(sender, text)
+                except Exception:
+                    self.logger.exception("Command '%s' failed", text)
+                    succeeded = False
+                finally:
+                    self.commandCapture.capture = None
+
+                lines.append("> %s" % text)
+                lines.extend(reply for reply in commandCapture.replies
+                    if reply != "")
+
+                if not succeeded or commandCapture.failed:
+                    skipped = commands[index + 1:]
+                    if len(skipped) > 0:
+                        lines.append("Stopped, skipped: %s" %
+                            ", ".join(skipped))
+                    break
+            return lines
+
+        def batchFinished(job, lines):
+            self.sendMessage(sender, "\n".join(lines))
+
+        self.jobManager.submit("batch of %d commands" % len(commands), sender,
+            runBatch, batchFinished, owner=self.__class__.__name__,
+            errorCallback=self._jobFailed)
+
+    def _jobFailed(self, job, error):
+        """
+        Tell the sender that a job raised an error (the traceback has
+        been logged by the job manager)
+        """
+        self._flagCommandFailure()
+        self.sendMessage(job.sender, "Job %d failed: %s" % (job.jobID,
+            job.description))
+
+    def _isBatchRunning(self):
+        """
+        Return True if the current thread runs a batch of commands
+        """
+        capture = getattr(self.commandCapture, "capture", None)
+        while capture != None:
+            if capture.hold:
+                return True
+            capture = capture.parent
+        return False
+
+    def _flagCommandFailure(self):
+        """
+        Mark the command running in the current thread as failed, used
+        by jobs which run inline as part of a batch
+        """
+        capture = getattr(self.commandCapture, "capture", None)
+        while capture != None:
+            capture.failed = True
+            capture = capture.parent
+
+    def _dispatchCommand(self, commandEntry, sender, arguments):
+        """
+        Call command handler and record count, errors and latency
+
+        Replies of cacheable commands are reused for the same arguments
+        until their TTL has passed, commands changing state drop the
+        cached replies of their scope
+        """
+        labels = {"command": commandEntry.name}
+        self.metrics.increment("commands_total", labels)
+        startTime = time.time()
+
+        scope = None
+        cacheKey = None
+        if commandEntry.cacheTTL != None or commandEntry.invalidatesCache:
+            scope = self._getCommandScope(commandEntry, sender, arguments)
+
+        if commandEntry.cacheTTL != None:
+            cacheKey = (commandEntry.name, tuple(arguments), scope)
+            replies = self.commandCache.get(cacheKey)
+            if replies != None:
+                self.metrics.increment("command_cache_hits_total", labels)
+                for text in replies:
+                    self.sendMessage(sender, text)
+                self.metrics.observe("command_duration_seconds",
+                    time.time() - startTime, labels)
+                return 0
+
+        outerCapture = getattr(self.commandCapture, "capture", None)
+        capture = None
+        if cacheKey != None:
+            capture = ReplyCapture(sender, parent=outerCapture)
+            self.commandCapture.capture = capture
+
+        try:
+            returnCode = self.commandHandlers[commandEntry.name](sender,
+                arguments)
+        except Exception:
+            self.metrics.increment("command_errors_total", labels)
+            raise
+        finally:
+            self.commandCapture.capture = outerCapture
+            self.metrics.observe("command_duration_seconds",
+                time.time() - startTime, labels)
+
+        if commandEntry.invalidatesCache:
+            self.invalidateCachedReplies(scope)
+
+        # handlers signal errors with a return code != 0
+        if returnCode:
+            self.metrics.increment("command_errors_total", labels)
+        elif capture != None and capture.cacheable and not capture.failed:
+            self.commandCache.put(cacheKey, scope, capture.replies,
+                commandEntry.cacheTTL)
+        return returnCode
+
+    def _getCommandScope(self, commandEntry, sender, arguments):
+        """
+        Return the resource (e.g. a repository) a command works on, used
+        to key and invalidate cached replies; None if the command doesn't
+        work on a single resource
+
+        To be overwritten in concrete bot implementations
+        """
+        return None
+
+    def invalidateCachedReplies(self, scope=None):
+        """
+        Drop cached replies of commands on scope (everything if None)
+
+        A cacheable command calling this changed state, so its own
+        replies aren't cached either
+        """
+        capture = getattr(self.commandCapture, "capture", None)
+        while capture != None:
+            capture.cacheable = False
+            capture = capture.parent
+        if self.commandCache != None:
+            self.commandCache.invalidate(scope)
 
     # handle the (generic) 'help' command
-    # collect all command handlers from the concrete bot implementation
-    # by introspection and extract the docstrings
+    # the help text is rendered once from the docstrings of all command
+    # handlers in the command registry of the concrete bot implementation
     def handleHelpCommand(self, sender, arguments):
         """
         help
 
         Get overview of all available commands
         """
-        docStrings = []
-
-        # get own member objects
-        memberObjects = inspect.getmembers(self, inspect.ismethod)
-        # traverse objects
-        for objectName, objectRef in memberObjects:
-            # get all command handlers
-            if (objectName.startswith("handle") and \
-                objectName.endswith("Command")):
-                # extract docstrings and append to array
-                docStrings.append(inspect.getdoc(objectRef).replace("\n\n", " - "))
-
-        # create message, containing help header with current class (subclass of
-        # GenericBot) and all help strings on separate lines
-        self.sendMessage(sender, "Help for %s\n\n%s" % (
-            self.__module__.split(".")[1], "\n".join(docStrings)))
+        self.sendMessage(sender, self.commandRegistry.helpText)
+
+    @command(maxArgs=0)
+    def handleJobsCommand(self, sender, arguments):
+        """
+        jobs
+
+        List currently queued and running jobs
+        """
+        jobs = self.jobManager.getJobs(self.__class__.__name__)
+        if len(jobs) == 0:
+            self.sendMessage(sender, "No jobs running")
+            return
+
+        lines = []
+        for job in jobs:
+            lines.append("%4d  %-9s %6.1fs  %s" % (job.jobID, job.state,
+                job.runtime(), job.description))
+        self.sendMessage(sender, "Jobs:\n%s" % "\n".join(lines))
+
+    @command(minArgs=1, maxArgs=1)
+    def handleCancelCommand(self, sender, arguments):
+        """
+        cancel <jobid>
+
+        Cancel a queued or running job
+        """
+        if len(arguments) != 1 or not arguments[0].isdigit():
+            self.sendMessage(sender,
+                "Usage: %s" % self._getDocForCurrentFunction())
+            return 1
+
+        jobID = int(arguments[0])
+        if self.jobManager.cancel(jobID, self.__class__.__name__):
+            self.sendMessage(sender, "Cancelled job %d" % jobID)
+        else:
+            self.sendMessage(sender, "No job with ID %d" % jobID)
+            return 1
+
+    @command(maxArgs=0)
+    def handleMoreCommand(self, sender, arguments):
+        """
+        more
+
+        Show next page of the last long result
+        """
+        return self._sendPage(sender,
+            self.getSession(sender).get("pageCursor", 0) + 1)
+
+    @command(minArgs=1, maxArgs=1)
+    def handlePageCommand(self, sender, arguments):
+        """
+        page <n>
+
+        Show page <n> of the last long result
+        """
+        if not arguments[0].isdigit():
+            self.sendMessage(sender,
+                "Usage: %s" % self._getDocForCurrentFunction())
+            return 1
+        return self._sendPage(sender, int(arguments[0]) - 1)
+
+    @command(maxArgs=0)
+    def handleAlertsCommand(self, sender, arguments):
+        """
+        alerts
+
+        List active alerts
+        """
+        alerts = self.alertManager.getAlerts()
+        if len(alerts) == 0:
+            self.sendMessage(sender, "No active alerts")
+            return
+
+        lines = []
+        for key, alert in alerts:
+            lines.append("[%s] %s (since %s)" % (alert["state"],
+                alert["message"], time.strftime("%m-%d %H:%M",
+                time.localtime(alert["since"]))))
+        self.sendMessage(sender, "\n".join(lines))
+
+    @command(maxArgs=0)
+    def handleTasksCommand(self, sender, arguments):
+        """
+        tasks
+
+        List scheduled tasks with their run statistics
+        """
+        lines = []
+        now = time.time()
+        for task in self.scheduler.getTasks(self.__class__.__name__):
+            if task.lastDuration == None:
+                lastRun = "never run"
+            else:
+                lastRun = "last run %.0fs ago, took %.2fs" % (
+                    now - task.lastRun, task.lastDuration)
+            lines.append("%s: every %ss, %s, %d runs, %d errors, %d overruns%s"
+                % (task.name, task.interval, lastRun, task.runs, task.errors,
+                task.overruns, " (running)" if task.running else ""))
+
+        if len(lines) == 0:
+            lines.append("No scheduled tasks")
+        self.sendMessage(sender, "\n".join(lines))
+
+    @command(minArgs=1)
+    def handleRuntaskCommand(self, sender, arguments):
+        """
+        runtask <name>
+
+        Run a scheduled task right away
+        """
+        name = " ".join(arguments)
+        task = self.scheduler.getTask(name, self.__class__.__name__)
+        if task == None:
+            self.sendMessage(sender, "No task with name '%s'" % name)
+            return 1
+
+        if not self.scheduler.runTask(task):
+            self.sendMessage(sender, "Task '%s' is still running" % task.name)
+            return 1
+        self.sendMessage(sender, "Started task '%s'" % task.name)
+
+    @command(maxArgs=0)
+    def handleReloadCommand(self, sender, arguments):
+        """
+        reload
+
+        Read the config file again without reconnecting
+        """
+        self.sendMessage(sender, "\n".join(self.reloadConfig()))
+
+    def _formatSeconds(self, seconds):
+        """
+        Return duration (e.g. a histogram bound) in a short format
+        """
+        if seconds == None:
+            return "-"
+        if seconds == float("inf"):
+            # quantile above the last histogram bucket
+            return ">%s" % self._formatSeconds(DEFAULT_BUCKETS[-1])
+        if seconds < 1:
+            return "%.0fms" % (seconds * 1000)
+        return "%.1fs" % seconds
+
+    @command(maxArgs=0)
+    def handleStatsCommand(self, sender, arguments):
+        """
+        stats
+
+        Show command counts and latencies, subprocess and message statistics
+        """
+        lines = ["Commands (count, errors, avg, p50, p99):"]
+        for labels, histogram in self.metrics.getHistograms(
+                "command_duration_seconds"):
+            lines.append("%-10s %5d %4d %8s %8s %8s" % (labels["command"],
+                histogram.count,
+                self.metrics.getCounter("command_errors_total", labels),
+                self._formatSeconds(histogram.sum / histogram.count),
+                self._formatSeconds(histogram.quantile(0.5)),
+                self._formatSeconds(histogram.quantile(0.99))))
+
+        for title, name in (("Subprocess spawn", "subprocess_spawn_seconds"),
+                ("Subprocess run", "subprocess_duration_seconds")):
+            for labels, histogram in self.metrics.getHistograms(name):
+                lines.append("%s: %d, avg %s, p99 %s" % (title,
+                    histogram.count,
+                    self._formatSeconds(histogram.sum / histogram.count),
+                    self._formatSeconds(histogram.quantile(0.99))))
+
+        for labels, histogram in self.metrics.getHistograms(
+                "task_duration_seconds"):
+            lines.append("Task '%s': %d runs, avg %s" % (labels["task"],
+                histogram.count,
+                self._formatSeconds(histogram.sum / histogram.count)))
+
+        cacheHits = sum(self.metrics.getCounter("command_cache_hits_total",
+            {"command": name}) for name in self.commandRegistry.commands)
+        lines.append("Cached replies: %d, served from cache: %d" % (
+            len(self.commandCache), cacheHits))
+
+        lines.append("Messages sent: %d, queued: %d, jobs: %d" % (
+            self.metrics.getCounter("messages_sent_total"),
+            self.messageQueue.depth(),
+            len(self.jobManager.getJobs(self.__class__.__name__))))
+
+        self.sendMessage(sender, "\n".join(lines))
@@ -7,7 +7,13 @@
 """
 
 from bots.GenericBot import GenericBot
+from framework.CommandRegistry import command
+from framework.GitRepositoryIndex import GitRepositoryIndex, RepositoryStatus
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
 import os
+import threading
+import time
 
 
 class GitBot(GenericBot):
@@ -25,75 +31,345 @@ class GitBot(GenericBot):
         self.configoptions.addConfigOption(
             name="gitdir",
             value="CHANGEME",
-            description="directory to store GIT clones")
+            description="directory to store GIT clones",
+            needsRestart=True)
 
         self.configoptions.addConfigOption(
             name="ghuser",
             value="CHANGEME",
             description="username for github.com")
 
-        # default repository when no parameter for repository
-        # operations is provided
-        self.defaultRepository = None
+        self.configoptions.addConfigOption(
+            name="rescaninterval",
+            value=300,
+            description="seconds between two full rescans of the git directory",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="repoworkers",
+            value=4,
+            description="number of repositories processed in parallel by 'all' operations",
+            optionType="int",
+            needsRestart=True)
+
+        self.configoptions.addConfigOption(
+            name="fetchinterval",
+            value=900,
+            description="seconds between background fetches of all clones (0 = off)",
+            optionType="int")
 
-    # clean up arguments sent by the client to avoid execution of
-    # arbitrary shell commands (e.g. by supplying arguments including
-    # characters as ';' or '&')
-    def _sanitizeArguments(self, sender, textArgument):
+        self.configoptions.addConfigOption(
+            name="fetchworkers",
+            value=2,
+            description="number of clones fetched in parallel in the background",
+            optionType="int",
+            needsRestart=True)
+
+        # index of the clones in 'gitdir' and worker pool for operations
+        # on several repositories, set up in _initializeBot
+        self.repositoryIndex = None
+        self.repositoryExecutor = None
+
+        # operations on the same repository are serialized by a lock
+        # per repository
+        self.repositoryLocks = {}
+        self.repositoryLocksLock = threading.Lock()
+
+        # status of the clones collected by the background fetch and
+        # the JIDs to notify if upstream of a watched repository moves
+        self.repositoryStatus = {}
+        self.repositoryWatchers = {}
+        self.fetchExecutor = None
+
+    def _initializeBot(self):
         """
-        Sanitize input, reject if it contains suspicious characters
-        that could lead to execution of arbitrary shell commands
+        build the clone index and keep it up to date
         """
-        errorMsg = ""
+        super(GitBot, self)._initializeBot()
 
-        # return error code if it contains ";" or "&"
-        if textArgument.find("&") != -1 or textArgument.find(";") != -1:
-            errorMsg = "ERROR: Invalid character found in argument"
+        # git is run directly (without a shell), look it up once
+        self.resolveBinary("git")
 
-        # if an error occurred (that is, an error msg is set, return 1
-        if errorMsg != "":
-            self.sendMessage(sender, errorMsg)
-            return 1, errorMsg
+        self.repositoryIndex = GitRepositoryIndex(self.configoptions["gitdir"])
+        self.repositoryIndex.rescan()
+        if not self.repositoryIndex.startWatching():
+            self.logger.info("inotify not available, relying on rescans of %s",
+                self.configoptions["gitdir"])
 
-        # no error occurred, return 0 and the input argument
-        return 0, textArgument
+        self.repositoryExecutor = ThreadPoolExecutor(
+            max_workers=self.configoptions["repoworkers"])
+        self.fetchExecutor = ThreadPoolExecutor(
+            max_workers=self.configoptions["fetchworkers"])
 
-    # construct fully qualified repository path for given _repository
-    # plus some sanity checks (e.g. if the dir is a valid repository)
-    def _getGitRepositoryPath(self, sender, repository):
+    def _shutdownBot(self):
         """
-        create fully qualified name for repository using the
-        ini setting 'gitdir', send error messages to sender
+        stop watching the git directory
         """
+        self.repositoryIndex.stopWatching()
+        self.repositoryExecutor.shutdown(wait=False)
+        self.fetchExecutor.shutdown(wait=False)
+        super(GitBot, self)._shutdownBot()
 
-        # sanitize repository name input (just to make sure nothing
-        # gets somehow messed up by strange control characters)
-        returnCode, repositoryPath = self._sanitizeArguments(sender, \
-            repository)
+    def _scheduleTasks(self):
+        """
+        add tasks to be scheduled to global scheduler
+        """
+        super(GitBot, self)._scheduleTasks()
 
-        if returnCode == 0:
+        # rescan the git directory periodically, this catches changes
+        # inotify missed or if inotify is not available at all
+        def rescanRepositories():
+            self.repositoryIndex.rescan()
 
-            # create fully qualified path
-            commandPath = os.path.join(self.configoptions["gitdir"], repository)
+        self.addTask("Rescan repositories",
+            self.configoptions["rescaninterval"], rescanRepositories)
 
-            # check if path exists at all
-            # don't reveal path in return message
-            if not os.path.exists(commandPath):
-                self.printDebugMessage(sender,
-                    "No git clone with name '%s' exists" % repository)
-                return 1, ""
+        # fetch all clones in the background and cache their status
+        def fetchRepositories():
+            self.taskFetchRepositories()
 
-            # check if constructed path is a valid git repository/clone
-            if not os.path.exists(os.path.join(commandPath, ".git")):
-                self.printDebugMessage(sender,
-                    "'%s' is no GIT repository" % commandPath)
-                return 1, ""
+        if self.configoptions["fetchinterval"] > 0:
+            self.addTask("Fetch repositories",
+                self.configoptions["fetchinterval"], fetchRepositories)
+
+    def _runGitJob(self, sender, repository, argv, commandPath,
+            description):
+        """
+        run git command for repository as a job and stream its output,
+        update the clone index when it has finished
+        """
+        def jobFinished(returnCode, result):
+            self.repositoryIndex.refresh(repository)
+            self._updateRepositoryStatus(repository, fetch=False)
+            self.invalidateCachedReplies(repository)
+            if returnCode == 0:
+                self.sendMessage(sender, "Finished %s" % description)
+            else:
+                self.sendMessage(sender, "Command failed! Error %s" %
+                    returnCode)
+
+        return self.executeCommandAsync(sender, argv, commandPath,
+            callback=jobFinished, description=description, stream=True,
+            lock=self._getRepositoryLock(repository))
+
+    def _getRepositoryLock(self, repository):
+        """
+        return the lock serializing operations on repository
+        """
+        with self.repositoryLocksLock:
+            lock = self.repositoryLocks.get(repository)
+            if lock == None:
+                lock = threading.Lock()
+                self.repositoryLocks[repository] = lock
+            return lock
+
+    def _selectRepositories(self, selector):
+        """
+        return names of all clones matching selector ('all' or a glob
+        pattern like 'proj-*'), None if selector names a single repository
+        """
+        if selector == "all":
+            return self.repositoryIndex.names()
+        if any(character in selector for character in "*?["):
+            return fnmatch.filter(self.repositoryIndex.names(), selector)
+        return None
+
+    def _runRepositoryOperation(self, job, operation, repository):
+        """
+        run git operation on a single repository of a multi-repository
+        job, returns status and duration
+        """
+        repositoryInfo = self.repositoryIndex.get(repository)
+        if repositoryInfo == None:
+            return "failed", 0.0
+
+        with self._getRepositoryLock(repository):
+            if job.cancelled:
+                return "cancelled", 0.0
+
+            startTime = time.time()
+            returnCode, result = self.executeCommand(["git", operation],
+                repositoryInfo.path, job)
+            duration = time.time() - startTime
+
+        self.repositoryIndex.refresh(repository)
+        self._updateRepositoryStatus(repository, fetch=False)
+        self.invalidateCachedReplies(repository)
+
+        if returnCode != 0:
+            return "failed", duration
+
+        # git reports unchanged repositories differently per operation,
+        # 'fetch' prints nothing at all if there is nothing new
+        normalizedResult = result.lower().replace("-", " ")
+        if "up to date" in normalizedResult or result.strip() == "":
+            return "up to date", duration
+        return "ok", duration
+
+    def _updateRepositoryStatus(self, repository, fetch=True):
+        """
+        fetch repository and cache its ahead/behind counts, dirty state
+        and last commit, notify watchers if upstream has moved
+
+        fetch is False right after a pull/push/fetch, which already
+        talked to the remote
+        """
+        repositoryInfo = self.repositoryIndex.get(repository)
+        if repositoryInfo == None:
+            self.repositoryStatus.pop(repository, None)
+            return
+
+        path = repositoryInfo.path
+        with self._getRepositoryLock(repository):
+            if fetch:
+                self.executeCommand(["git", "fetch", "--quiet"], path)
+            returnCode, counts = self.executeCommand(["git", "rev-list",
+                "--left-right", "--count", "HEAD...@{upstream}"], path)
+            _, changes = self.executeCommand(["git", "status", "--porcelain"],
+                path)
+            _, lastCommit = self.executeCommand(
+                ["git", "log", "-1", "--format=%h %an, %ar: %s"], path)
+            _, upstreamHead = self.executeCommand(
+                ["git", "rev-parse", "@{upstream}"], path)
+
+        ahead = behind = None
+        if returnCode == 0 and len(counts.split()) == 2:
+            ahead, behind = [int(count) for count in counts.split()]
+
+        status = RepositoryStatus(ahead, behind, changes.strip() != "",
+            lastCommit.strip(), upstreamHead.strip())
+        oldStatus = self.repositoryStatus.get(repository)
+        self.repositoryStatus[repository] = status
+        self.invalidateCachedReplies(repository)
+
+        # notify watchers if upstream moved since the last fetch
+        if oldStatus != None and status.upstreamHead != "" and \
+                oldStatus.upstreamHead != status.upstreamHead:
+            watchers = list(self.repositoryWatchers.get(repository, {}).values())
+            if len(watchers) > 0:
+                self.sendMessage(watchers, "Upstream of '%s' has moved: %s" %
+                    (repository, status.describe()))
+
+    # callback to fetch all clones in the background
+    def taskFetchRepositories(self):
+        """
+        Fetch all clones and update their cached status
+        """
+        repositories = self.repositoryIndex.names()
+
+        # forget status of clones which are gone
+        for repository in list(self.repositoryStatus):
+            if repository not in repositories:
+                self.repositoryStatus.pop(repository, None)
+
+        # the scheduler skips the next run while this one is going
+        futures = [self.fetchExecutor.submit(self._updateRepositoryStatus,
+            repository) for repository in repositories]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                self.logger.info("Background fetch failed: %s", e)
+
+    def _runMultiRepositoryCommand(self, sender, operation, repositories):
+        """
+        run git operation on several repositories in parallel as a
+        single job, send one summary table when all have finished
+        """
+        if len(repositories) == 0:
+            self.sendMessage(sender, "No matching git clones found")
+            return 1
+
+        def runOperation(job):
+            futures = [(repository, self.repositoryExecutor.submit(
+                    self._runRepositoryOperation, job, operation, repository))
+                for repository in repositories]
+            return [(repository, future.result())
+                for repository, future in futures]
+
+        def operationFinished(job, results):
+            counts = {}
+            lines = []
+            nameWidth = max(len(repository) for repository, _ in results)
+            for repository, (status, duration) in results:
+                counts[status] = counts.get(status, 0) + 1
+                lines.append("%-*s  %-10s %6.1fs" % (nameWidth, repository,
+                    status, duration))
+
+            summary = ", ".join("%d %s" % (counts[status], status)
+                for status in ("ok", "failed", "up to date", "cancelled")
+                if status in counts)
+            if "failed" in counts:
+                self._flagCommandFailure()
+            self.sendMessage(sender, "%s: %s (%.1fs)\n%s" % (operation,
+                summary, job.runtime(), "\n".join(lines)))
+
+        # within a batch of commands the job runs inline
+        inline = self._isBatchRunning()
+        description = "%s %d repositories" % (operation, len(repositories))
+        jobID = self.jobManager.submit(description, sender, runOperation,
+            operationFinished, owner=self.__class__.__name__, inline=inline,
+            errorCallback=self._jobFailed)
+        if not inline:
+            self.sendMessage(sender, "Started job %d: %s" % (jobID, description))
+        return 0
+
+    def _getDefaultRepository(self, sender):
+        """
+        return default repository of sender (set with 'setrepo'), None
+        if not set
+        """
+        return self.getSession(sender).get("defaultRepository")
+
+    def _getCommandScope(self, commandEntry, sender, arguments):
+        """
+        Return the repository a command works on, the first argument if
+        it names a clone, otherwise the default repository
+
+        None for commands on all clones (e.g. 'all' or a pattern)
+        """
+        # commands without arguments like 'list' don't work on a clone
+        if commandEntry.maxArgs == 0:
+            return None
+        if len(arguments) > 0:
+            if self.repositoryIndex.get(arguments[0]) != None:
+                return arguments[0]
+            if self._selectRepositories(arguments[0]) != None:
+                return None
+        return self._getDefaultRepository(sender)
+
+    # arguments are passed to git as separate argv entries, so they
+    # can't run other commands; they mustn't be taken as git options
+    def _checkName(self, sender, name, kind):
+        """
+        Check a name given by the client (e.g. of a branch), reject it if
+        git would take it as an option, send error messages to sender
+        """
+        if name.startswith("-"):
+            self.sendMessage(sender, "ERROR: Invalid %s name '%s'" %
+                (kind, name))
+            return 1
+        return 0
 
-            return 0, commandPath
+    # look up fully qualified repository path for given repository
+    # plus some sanity checks (e.g. if the dir is a valid repository)
+    def _getGitRepositoryPath(self, sender, repository):
+        """
+        return path of the clone repository in the ini setting
+        'gitdir', send error messages to sender
+        """
+        # look up clone in the index
+        # don't reveal path in return message
+        repositoryInfo = self.repositoryIndex.get(repository)
+        if repositoryInfo == None:
+            self.printDebugMessage(sender,
+                "No git clone with name '%s' exists" % repository)
+            return 1, ""
 
-        return returnCode, ""
+        return 0, repositoryInfo.path
 
     # handler for the 'git commit -a [-m <message>]' command
+    @command(aliases=("ci",), invalidatesCache=True)
     def handleCommitCommand(self, sender, arguments):
         """
         commit [<repository>] [<message>]
@@ -105,61 +381,61 @@ class GitBot(GenericBot):
         if len(arguments) == 0:
             # no arguments provided, send help (using __doc__) if no
             # default repository is set
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
                 self.printDebugMessage(sender, "No default repository set")
                 return 2
             else:
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
         else:
             repository = arguments[0]
 
         self.printDebugMessage(sender,
             "Trying to commit repository '%s'" % repository)
 
-        returnCode = 0
-
         if len(arguments) > 1:
             commitMsg = ' '.join(arguments[1:]).strip('"')
-            returnCode, commitMsg = self._sanitizeArguments(
-                sender, commitMsg)
         else:
             commitMsg = "Autocommit using GitBot"
 
-        # we can safely ignore the case when the returnCode was != 0
-        # as an error message is sent by _sanitizeArguments
+        returnCode, commandPath = \
+            self._getGitRepositoryPath(sender, repository)
         if returnCode == 0:
-            returnCode, commandPath = \
-                self._getGitRepositoryPath(sender, repository)
+            # execute git commit command and send result to sender, the
+            # message is passed as a single argument
+            returnCode, result = self.executeCommand(
+                ["git", "commit", "-a", "-m", commitMsg], commandPath)
+            self.repositoryIndex.refresh(repository)
+            self.invalidateCachedReplies(repository)
             if returnCode == 0:
-                # execute git commit command and send result to sender
-                returnCode, result = \
-                    self.executeShellCommand(
-                        "git commit -a -m \"%s\"" % commitMsg,
-                        commandPath)
-                if returnCode == 0:
-                    self.sendMessage(sender, result)
-                elif returnCode == 1:
-                    self.sendMessage(sender, "Nothing to commit")
+                self.sendMessage(sender, result)
+            elif returnCode == 1:
+                self.sendMessage(sender, "Nothing to commit")
+            else:
+                self.sendMessage(sender, "Commit failed! Error %s" %
+                    returnCode)
+
+        return returnCode
 
     # handler for the 'git pull' command
+    @command(invalidatesCache=True)
     def handlePullCommand(self, sender, arguments):
         """
-        pull [[<repository>] | [help]]
+        pull [[<repository>|all|<pattern>] | [help]]
 
-        Pull a directory from its origin
+        Pull a directory (or all clones matching a pattern) from its origin
         """
         repository = None
 
         if len(arguments) == 0:
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
                 self.printDebugMessage(sender, "No default repository set")
                 return 2
             else:
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
         elif len(arguments) == 1 and arguments[0] == "help":
             # no arguments provided, send help (using __doc__)
             self.sendMessage(sender,
@@ -171,35 +447,44 @@ class GitBot(GenericBot):
         # all other arguments are ignored (for now)
         if repository == None:
             repository = arguments[0]
+
+        # 'all' or a glob selector - pull all matching clones in parallel
+        repositories = self._selectRepositories(repository)
+        if repositories != None:
+            return self._runMultiRepositoryCommand(sender, "pull", repositories)
+
         self.printDebugMessage(sender, "Trying to pull repository '%s'" %
             repository)
 
         returnCode, commandPath = self._getGitRepositoryPath(sender,
             repository)
         if returnCode == 0:
-            # execute git pull command and send result to sender
-            returnCode, result = self.executeShellCommand("git pull",
-                commandPath)
-            if returnCode == 0:
-                self.sendMessage(sender, result)
+            # execute git pull command as a job, the output is streamed
+            # to the sender while it runs
+            self._runGitJob(sender, repository, ["git", "pull", "--progress"],
+                commandPath, "pull %s" % repository)
+
+        return returnCode
 
     # handler for the 'git push' command
+    @command(invalidatesCache=True)
     def handlePushCommand(self, sender, arguments):
         """
-        push [<repository>]
+        push [<repository>|all|<pattern>]
 
-        Push a given directory to its origin
+        Push a given directory (or all clones matching a pattern) to its origin
         """
         if len(arguments) == 0:
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 # no arguments provided and default repository not set
                 # send help (using __doc__)
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
-                self.printDebugMessage("No repository name for 'push' provided.")
+                self.printDebugMessage(sender,
+                    "No repository name for 'push' provided.")
                 return 2
             else:
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
         elif len(arguments) == 1 and arguments[0] == "help":
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
@@ -208,20 +493,63 @@ class GitBot(GenericBot):
             # arguments given, the first one is treated as the repository
             # all other arguments are ignored (for now)
             repository = arguments[0]
-            
+
+        # 'all' or a glob selector - push all matching clones in parallel
+        repositories = self._selectRepositories(repository)
+        if repositories != None:
+            return self._runMultiRepositoryCommand(sender, "push", repositories)
+
         self.printDebugMessage(sender, "Trying to push repository '%s'" %
             repository)
 
         returnCode, commandPath = self._getGitRepositoryPath(sender,
             repository)
         if returnCode == 0:
-            # execute git push command and send result to sender
-            returnCode, result = self.executeShellCommand("git push",
-                commandPath)
-            if returnCode == 0:
-                self.sendMessage(sender, result)
+            # execute git push command as a job, the output is streamed
+            # to the sender while it runs
+            self._runGitJob(sender, repository, ["git", "push", "--progress"],
+                commandPath, "push %s" % repository)
+
+        return returnCode
+
+    # handler for the 'git fetch' command
+    @command(maxArgs=1, invalidatesCache=True)
+    def handleFetchCommand(self, sender, arguments):
+        """
+        fetch [<repository>|all|<pattern>]
+
+        Fetch a given directory (or all clones matching a pattern) from its origin
+        """
+        if len(arguments) == 0:
+            if self._getDefaultRepository(sender) == None:
+                self.sendMessage(sender,
+                    "Usage: %s" % self._getDocForCurrentFunction())
+                self.printDebugMessage(sender, "No default repository set")
+                return 2
+            repository = self._getDefaultRepository(sender)
+        else:
+            repository = arguments[0]
+
+        # 'all' or a glob selector - fetch all matching clones in parallel
+        repositories = self._selectRepositories(repository)
+        if repositories != None:
+            return self._runMultiRepositoryCommand(sender, "fetch", repositories)
+
+        self.printDebugMessage(sender, "Trying to fetch repository '%s'" %
+            repository)
+
+        returnCode, commandPath = self._getGitRepositoryPath(sender,
+            repository)
+        if returnCode == 0:
+            # execute git fetch command as a job, the output is streamed
+            # to the sender while it runs
+            self._runGitJob(sender, repository, ["git", "fetch", "--progress"],
+                commandPath, "fetch %s" % repository)
+
+        return returnCode
 
     # handler for the 'git clone' command
+    @command(minArgs=1, maxArgs=2, invalidatesCache=True)
     def handleCloneCommand(self, sender, arguments):
         """
         clone <targeturl> [<localname>]
@@ -232,16 +560,15 @@ class GitBot(GenericBot):
             # no arguments provided, send help (using __doc__)
             self.sendMessage(sender,
                 "Usage: %s" % self._getDocForCurrentFunction())
-            self.printDebugMessage("No URL for 'clone' provided.")
+            self.printDebugMessage(sender, "No URL for 'clone' provided.")
         else:
             # arguments given, the first one is treated as the URL
             targetURL = arguments[0]
             if len(arguments) >= 2:
-                returnCode, localName = \
-                    self._sanitizeArguments(sender, arguments[1])
+                localName = arguments[1]
             else:
-                returnCode = 0
                 localName = ""
+            returnCode = self._checkName(sender, localName, "clone")
 
             if returnCode == 0:
                 self.printDebugMessage(sender, "Trying to clone from URL '%s'" %
@@ -249,23 +576,41 @@ class GitBot(GenericBot):
 
                 commandPath = self.configoptions["gitdir"]
 
-                if not os.path.exists(commandPath):
+                if not self.repositoryIndex.exists:
                     self.printDebugMessage(sender,
                         "Target git directory doesn't exist, check your config!")
                     return 1, ""
 
-                # execute git clone command and send result to sender
-                returnCode, result = self.executeShellCommand(
-                    "git clone %s %s" % (targetURL, localName), commandPath)
-                if returnCode == 0:
-                    self.sendMessage(sender, "%sCompleted successful!" % result)
-                elif returnCode == 128:
-                    self.sendMessage(sender, "Target cloning directory already exists")
-                else:
-                    self.sendMessage(sender, "Cloning failed! Error %s" %
-                        returnCode)
+                # name of the new clone, derived from the URL if not given
+                cloneName = localName
+                if cloneName == "":
+                    cloneName = os.path.basename(targetURL.rstrip("/"))
+                    if cloneName.endswith(".git"):
+                        cloneName = cloneName[:-len(".git")]
+
+                # send result of the clone job to sender
+                def cloneFinished(returnCode, result):
+                    self.repositoryIndex.refresh(cloneName)
+                    self.invalidateCachedReplies(cloneName)
+                    if returnCode == 0:
+                        self.sendMessage(sender, "%sCompleted successful!" % result)
+                    elif returnCode == 128:
+                        self.sendMessage(sender, "Target cloning directory already exists")
+                    else:
+                        self.sendMessage(sender, "Cloning failed! Error %s" %
+                            returnCode)
+
+                # execute git clone command as a job, stream its progress;
+                # '--' keeps git from taking the URL as an option
+                argv = ["git", "clone", "--progress", "--", targetURL]
+                if localName != "":
+                    argv.append(localName)
+                self.executeCommandAsync(sender, argv,
+                    commandPath, callback=cloneFinished,
+                    description="clone %s" % targetURL, stream=True)
 
     # handler for the 'git branch [-a]' command
+    @command(maxArgs=2, cacheTTL=5)
     def handleBranchCommand(self, sender, arguments):
         """
         branch [<repository>] [<branchname>]
@@ -275,19 +620,20 @@ class GitBot(GenericBot):
         branchname = None
         
         if len(arguments) == 0:
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 # no arguments provided, send help (using __doc__)
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
-                self.printDebugMessage("No repository name for 'branch' provided.")
+                self.printDebugMessage(sender,
+                    "No repository name for 'branch' provided.")
                 return 2
             else:
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
         elif len(arguments) == 1:
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 repository = arguments[0]
             else:
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
                 branchname = arguments[0]
         else:
             repository = arguments[0]
@@ -296,7 +642,7 @@ class GitBot(GenericBot):
         returnCode, commandPath = \
             self._getGitRepositoryPath(sender, repository)
 
-        self.logger.debug("Repository path: %s" % commandPath)
+        self.logger.debug("Repository path: %s", commandPath)
 
         # repository name is valid
         if returnCode == 0:
@@ -308,26 +654,29 @@ class GitBot(GenericBot):
                     "Listing branches of repository '%s'" % repository)
 
                 # execute git branch command and send result to sender
-                returnCode, result = self.executeShellCommand(
-                    "git branch -a", commandPath)
+                returnCode, result = self.executeCommand(
+                    ["git", "branch", "-a"], commandPath)
             else:
-                # get new branch name
-                returnCode, branchname = self._sanitizeArguments(
-                sender, branchname)
+                # check new branch name
+                returnCode = self._checkName(sender, branchname, "branch")
 
                 if returnCode == 0:
                     self.printDebugMessage(sender,
                         "Creating branch '%s' in repository '%s'" %
                         (branchname, repository))
+                    self.invalidateCachedReplies(repository)
 
                     # execute git branch command and send result to sender
-                    returnCode, result = self.executeShellCommand(
-                        "git branch %s", (commandPath, branchname))
+                    returnCode, result = self.executeCommand(
+                        ["git", "branch", branchname], commandPath)
 
             if returnCode == 0:
                 self.sendMessage(sender, result)
 
+        return returnCode
+
     # handler to set default repository
+    @command(minArgs=1, maxArgs=1)
     def handleSetrepoCommand(self, sender, arguments):
         """
         setrepo <repository>
@@ -339,6 +688,7 @@ class GitBot(GenericBot):
             self.sendMessage(sender,
                 "Usage: %s" % self._getDocForCurrentFunction())
             self.logger.debug("No repository name to set as default provided.")
+            return 1
 
         # one parameter given - set as default repository
         elif len(arguments) == 1:
@@ -346,34 +696,38 @@ class GitBot(GenericBot):
             returnCode, commandPath = \
                 self._getGitRepositoryPath(sender, repository)
 
-            self.logger.debug("Repository path: %s" % commandPath)
+            self.logger.debug("Repository path: %s", commandPath)
 
             # repository name is valid
             if returnCode == 0:
 
-                self.defaultRepository = repository
+                self.getSession(sender).set("defaultRepository", repository)
 
                 self.printDebugMessage(sender,
                     "Setting default repository to '%s'" % repository)
 
+            return returnCode
+
     # handler to unset default repository
+    @command(maxArgs=0)
     def handleClearrepoCommand(self, sender, arguments):
         """
         clearrepo
 
         Unset default working repository for all following operations
         """
-        if self.defaultRepository == None:
+        if self._getDefaultRepository(sender) == None:
             self.printDebugMessage(sender,
                 "No default repository set")
         else:
-            oldRepo = self.defaultRepository
-            self.defaultRepository = None
+            oldRepo = self._getDefaultRepository(sender)
+            self.getSession(sender).set("defaultRepository", None)
 
             self.printDebugMessage(sender,
                 "Unset default repository, was '%s'" % oldRepo)
 
     # handler to change a branch in git using 'checkout'
+    @command(aliases=("co",), minArgs=1, maxArgs=2, invalidatesCache=True)
     def handleCheckoutCommand(self, sender, arguments):
         """
         checkout [<repository>] <branch>
@@ -387,11 +741,11 @@ class GitBot(GenericBot):
             self.logger.debug("No repo and branch name provided.")
             return 1
 
-        # one parameter  - branch if self.defaultRepository is set
+        # one parameter  - branch if a default repository is set
         elif len(arguments) == 1:
             # default repository has not been set using 'setrepo'
             # deny operation
-            if self.defaultRepository == None:
+            if self._getDefaultRepository(sender) == None:
                 self.sendMessage(sender,
                     "Usage: %s" % self._getDocForCurrentFunction())
                 self.printDebugMessage(sender,
@@ -399,31 +753,32 @@ class GitBot(GenericBot):
                 return 1
             else:
                 # default repository is set
-                repository = self.defaultRepository
+                repository = self._getDefaultRepository(sender)
                 branch = arguments[0]
         # two parameters (repository and branch) were provided
         else:
             repository = arguments[0]
             branch = arguments[1]
 
-        # sanitize arguments
-        returnCode, repository = self._sanitizeArguments(sender, repository)
-        if returnCode == 0:
-            returnCode, branch = self._sanitizeArguments(sender, branch)
+        # check branch name
+        returnCode = self._checkName(sender, branch, "branch")
 
         if returnCode == 0:
             # check if given repository is valid
             returnCode, commandPath = \
                 self._getGitRepositoryPath(sender, repository)
 
-            self.logger.debug("Repository path: %s" % commandPath)
+            self.logger.debug("Repository path: %s", commandPath)
 
             # repository name is valid, continue
             if returnCode == 0:
 
-                # execute git checkout command to change branch
-                returnCode, result = self.executeShellCommand(
-                    "git checkout %s" % branch, commandPath)
+                # execute git checkout command to change branch, '--'
+                # keeps git from taking the branch as a path
+                returnCode, result = self.executeCommand(
+                    ["git", "checkout", branch, "--"], commandPath)
+                self.repositoryIndex.refresh(repository)
+                self.invalidateCachedReplies(repository)
 
                 if returnCode == 0:
                     # branch change successful
@@ -433,24 +788,95 @@ class GitBot(GenericBot):
                     self.sendMessage(sender,
                         "Checking out branch '%s' failed" % branch)
 
+        return returnCode
+
     # handler to list current local clones
+    @command(aliases=("ls",), maxArgs=0, cacheTTL=5)
     def handleListCommand(self, sender, arguments):
         """
         list
 
         List current local clones
         """
-        directories = []
+        if self.repositoryIndex.exists:
+            self.sendMessage(sender, "Git clones:\n%s" %
+                "\n".join(self.repositoryIndex.names()))
+        else:
+            self.sendMessage(sender,
+                "Git directory doesn’t exist")
 
-        gitPath = self.configoptions["gitdir"]
-        if os.path.exists(gitPath):
-            for directory in os.listdir(gitPath):
-                pathDir = os.path.join(gitPath, directory)
-                if os.path.exists(os.path.join(pathDir, ".git")):
-                    directories.append(directory)
+    # handler to show the cached status of clones
+    @command(maxArgs=1, cacheTTL=5)
+    def handleStatusCommand(self, sender, arguments):
+        """
+        status [<repository>|all|<pattern>]
 
-            self.sendMessage(sender, "Git clones:")
-            self.sendMessage(sender, "\n".join(directories))
+        Show ahead/behind, dirty state and last commit from the background fetch
+        """
+        if len(arguments) == 0:
+            if self._getDefaultRepository(sender) == None:
+                selector = "all"
+            else:
+                selector = self._getDefaultRepository(sender)
         else:
+            selector = arguments[0]
+
+        repositories = self._selectRepositories(selector)
+        if repositories == None:
+            if self.repositoryIndex.get(selector) == None:
+                self.sendMessage(sender,
+                    "No git clone with name '%s' exists" % selector)
+                return 1
+            repositories = [selector]
+
+        if len(repositories) == 0:
+            self.sendMessage(sender, "No matching git clones found")
+            return 1
+
+        nameWidth = max(len(repository) for repository in repositories)
+        lines = []
+        for repository in repositories:
+            status = self.repositoryStatus.get(repository)
+            if status == None:
+                description = "not fetched yet"
+            else:
+                description = status.describe()
+            lines.append("%-*s  %s" % (nameWidth, repository, description))
+
+        self.sendMessage(sender, "\n".join(lines))
+
+    # handler to get notified when upstream of a repository moves
+    @command(minArgs=1, maxArgs=1)
+    def handleWatchCommand(self, sender, arguments):
+        """
+        watch <repository>
+
+        Get notified when upstream of <repository> moves
+        """
+        repository = arguments[0]
+        if self.repositoryIndex.get(repository) == None:
             self.sendMessage(sender,
-                "Git directory doesn’t exist")
+                "No git clone with name '%s' exists" % repository)
+            return 1
+
+        self.repositoryWatchers.setdefault(repository, {})[sender.bare] = sender
+        self.sendMessage(sender, "Watching repository '%s'" % repository)
+
+    # handler to stop notifications for a repository
+    @command(minArgs=1, maxArgs=1)
+    def handleUnwatchCommand(self, sender, arguments):
+        """
+        unwatch <repository>
+
+        Stop notifications for <repository>
+        """
+        repository = arguments[0]
+        watchers = self.repositoryWatchers.get(repository, {})
+        if watchers.pop(sender.bare, None) == None:
+            self.sendMessage(sender,
+                "Repository '%s' is not watched" % repository)
+            return 1
+
+        if len(watchers) == 0:
+            self.repositoryWatchers.pop(repository, None)
+        self.sendMessage(sender, "Stopped watching repository '%s'" % repository)
@@ -7,7 +7,13 @@
 """
 
 from bots.GenericBot import GenericBot
+from framework.AlertManager import AlertThresholds
+from framework.CommandRegistry import command
+from framework.ProcStats import ProcStats
+from framework.RingBuffer import RingBuffer
 import os                   # needed for free space detection
+import socket               # host name for messages
+import time                 # timestamps for disk usage history
 
 
 class LinuxBot(GenericBot):
@@ -25,20 +31,73 @@ class LinuxBot(GenericBot):
         self.configoptions.addConfigOption(
             name="fsdirs",
             value="/tmp",
-            description="filesystem directories to monitor for free space")
+            description="filesystem directories to monitor for free space",
+            optionType="pathlist")
 
         self.configoptions.addConfigOption(
             name="fslimit",
-            value="10",
-            description="alarm limit filesystem threshold")
+            value=90,
+            description="warning threshold of filesystem usage (percent used)",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="fscritlimit",
+            value=95,
+            description="critical threshold of filesystem usage (percent used)",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="fshysteresis",
+            value=5,
+            description="percent usage has to drop below a limit to clear an alarm",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="fshistory",
+            value=1440,
+            description="number of disk usage samples kept per mount point",
+            optionType="int")
+
+        self.configoptions.addConfigOption(
+            name="fstrendwindow",
+            value=3600,
+            description="seconds of history used to compute the fill rate",
+            optionType="float")
+
+        self.configoptions.addConfigOption(
+            name="fsfullhours",
+            value=2,
+            description="alarm if a filesystem is predicted to be full within these hours",
+            optionType="float")
+
+        # disk usage history per mount point
+        self.diskHistory = {}
+
+        # system statistics read from /proc, set up in _initializeBot
+        self.procStats = None
+
+    def _initializeBot(self):
+        """
+        open /proc files for the stats commands
+        """
+        super(LinuxBot, self)._initializeBot()
+        self.procStats = ProcStats()
+        self.hostname = socket.gethostname()
+
+    def _shutdownBot(self):
+        """
+        close /proc files
+        """
+        self.procStats.close()
+        super(LinuxBot, self)._shutdownBot()
 
     def _scheduleTasks(self):
         """
         add tasks to be scheduled to global scheduler
 
         The scheduler needs a callback to be called after the given interval
-        has passed. As it accepts no class functions as callback, we create a
-        wrapper using a local function which calls the class function
+        has passed. Tasks run in the task worker pool, so a hanging statvfs
+        doesn't block message handling.
         """
 
         super(LinuxBot, self)._scheduleTasks()
@@ -47,19 +106,118 @@ class LinuxBot(GenericBot):
         def checkFreeSpace():
             self.taskCheckFreeSpace()
 
-        self.schedule("Check Free Space", 60, checkFreeSpace, repeat=True)
+        self.addTask("Check Free Space", 60, checkFreeSpace)
+
+    def _formatBytes(self, value):
+        """
+        Return human readable representation of a byte count
+        """
+        for unit in ("B", "KB", "MB", "GB", "TB"):
+            if abs(value) < 1024 or unit == "TB":
+                return "%.1f%s" % (value, unit)
+            value = value / 1024.0
+
+    def _formatDuration(self, seconds):
+        """
+        Return duration in days, hours and minutes
+        """
+        minutes = int(seconds) // 60
+        days, minutes = divmod(minutes, 24 * 60)
+        hours, minutes = divmod(minutes, 60)
+        if days > 0:
+            return "%d days, %d:%02d" % (days, hours, minutes)
+        return "%d:%02d" % (hours, minutes)
+
+    def _getLoadText(self):
+        """
+        Return load averages as text
+        """
+        load1, load5, load15, processes = self.procStats.loadavg()
+        return "load average: %.2f, %.2f, %.2f (%s processes)" % (
+            load1, load5, load15, processes)
 
     # handler for the Linux 'uptime' command
+    @command(maxArgs=0, cacheTTL=1)
     def handleUptimeCommand(self, sender, arguments):
         """
         uptime
 
         Show the system uptime and load
         """
-        # execute git pull command and send result to sender
-        returnCode, result = self.executeShellCommand("echo $HOSTNAME && uptime")
-        if returnCode == 0:
-            self.sendMessage(sender, result)
+        self.sendMessage(sender, "%s\nup %s, %s" % (self.hostname,
+            self._formatDuration(self.procStats.uptime()),
+            self._getLoadText()))
+
+    @command(maxArgs=0, cacheTTL=1)
+    def handleLoadCommand(self, sender, arguments):
+        """
+        load
+
+        Show the system load averages
+        """
+        self.sendMessage(sender, self._getLoadText())
+
+    @command(maxArgs=0, cacheTTL=1)
+    def handleMemCommand(self, sender, arguments):
+        """
+        mem
+
+        Show memory and swap usage
+        """
+        meminfo = self.procStats.meminfo()
+        total = meminfo.get("MemTotal", 0) * 1024
+        available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0)) * 1024
+        swapTotal = meminfo.get("SwapTotal", 0) * 1024
+        swapFree = meminfo.get("SwapFree", 0) * 1024
+
+        self.sendMessage(sender,
+            "Mem:  %s used of %s (%s available)\nSwap: %s used of %s" % (
+            self._formatBytes(total - available), self._formatBytes(total),
+            self._formatBytes(available),
+            self._formatBytes(swapTotal - swapFree),
+            self._formatBytes(swapTotal)))
+
+    @command(maxArgs=0)
+    def handleCpuCommand(self, sender, arguments):
+        """
+        cpu
+
+        Show CPU usage since the last 'cpu' command
+        """
+        shares = self.procStats.cpu()
+        self.sendMessage(sender, "CPU: " + ", ".join("%.1f%% %s" %
+            (shares[name], name) for name in ("user", "system", "iowait",
+            "idle", "nice", "steal")))
+
+    @command(maxArgs=0)
+    def handleNetCommand(self, sender, arguments):
+        """
+        net
+
+        Show network throughput per interface since the last 'net' command
+        """
+        lines = []
+        for interface, (received, sent) in sorted(self.procStats.net().items()):
+            lines.append("%-10s rx %s/s, tx %s/s" % (interface,
+                self._formatBytes(received), self._formatBytes(sent)))
+        self.sendMessage(sender, "\n".join(lines))
+
+    @command(maxArgs=0)
+    def handleIoCommand(self, sender, arguments):
+        """
+        io
+
+        Show disk I/O per device since the last 'io' command
+        """
+        lines = []
+        for device, (reads, writes, readBytes, writtenBytes) in \
+                sorted(self.procStats.io().items()):
+            lines.append("%-10s %.1f r/s, %.1f w/s, read %s/s, write %s/s" % (
+                device, reads, writes, self._formatBytes(readBytes),
+                self._formatBytes(writtenBytes)))
+        if len(lines) == 0:
+            lines.append("No block devices with I/O found")
+        self.sendMessage(sender, "\n".join(lines))
 
     # taken from http://stackoverflow.com/questions/51658/\
     # cross-platform-space-remaining-on-volume-using-python
@@ -73,6 +231,22 @@ class LinuxBot(GenericBot):
         freeSpace = stats.f_bavail * stats.f_frsize
         return 100 - (freeSpace / totalSize * 100)
 
+    def _getTimeToFull(self, fsdir):
+        """
+        Return predicted seconds until fsdir is full based on the fill rate
+        (None if usage is not growing)
+        """
+        history = self.diskHistory.get(fsdir)
+        if history == None or len(history) == 0:
+            return None
+
+        timestamp, usedSpace = history.latest()
+        fillRate = history.slope(
+            since=timestamp - self.configoptions["fstrendwindow"])
+        if fillRate == None or fillRate <= 0:
+            return None
+        return (100 - usedSpace) / fillRate
+
     # callback to check system free space
     def taskCheckFreeSpace(self):
         """
@@ -80,29 +254,88 @@ class LinuxBot(GenericBot):
         """
         self.logger.debug("Performing task taskCheckFreeSpace")
 
-        resultMsg = "\n"
+        now = time.time()
+        hysteresis = self.configoptions["fshysteresis"]
+        warnLimit = self.configoptions["fslimit"]
+        critLimit = self.configoptions["fscritlimit"]
+        fullLimit = self.configoptions["fsfullhours"] * 3600
+
+        usageThresholds = AlertThresholds(warnLimit, warnLimit - hysteresis,
+            critLimit, critLimit - hysteresis)
+        # remaining time until full, lower is worse
+        fullThresholds = AlertThresholds(fullLimit, fullLimit * 1.5,
+            higherIsWorse=False)
+
+        # get current host name to include in the alert messages
+        curHost = self.hostname.split(".")[0]
 
         # get free space (in %) for every configured mount point
-        for fsdir in self.configoptions["fsdirs"].split():
+        alertKeys = []
+        for fsdir in self.configoptions["fsdirs"]:
             curSpace = self._getUsedSpaceInPercent(fsdir)
 
-            # if it's above the threshold, add mount point and
-            # currently used space to the result msg
-            if curSpace > self.fsthreshold:
-                resultMsg = resultMsg + "%-10s" % fsdir + \
-                    ": %.0f%%" % curSpace + " used\n"
-
-        # send a message to all registered JIDs if we found at least one
-        # mount point who is above the threshold -> there is something
-        # in the result message
-        if resultMsg != "\n":
-
-            # get current host name to include in the result message
-            import socket
-            curHost = socket.gethostbyaddr(socket.gethostname())[0].split(".")[0]
-
-            # create final message and send it out
-            resultMsg = "Free disk space is low on host '%s'\n" % curHost + \
-                resultMsg
-            for jid in self.targetJIDs:
-                self.sendMessage(jid, resultMsg)
+            # record sample in the history of the mount point
+            history = self.diskHistory.get(fsdir)
+            if history == None:
+                history = RingBuffer(self.configoptions["fshistory"])
+                self.diskHistory[fsdir] = history
+            history.append(now, curSpace)
+
+            # the alert manager only notifies on state changes and
+            # repeats active alerts with an increasing interval
+            alertKeys.extend(("disk:%s" % fsdir, "diskfull:%s" % fsdir))
+            self.updateAlert("disk:%s" % fsdir, curSpace, usageThresholds,
+                "Free disk space is low on host '%s': %s %.0f%% used" %
+                (curHost, fsdir, curSpace))
+
+            timeToFull = self._getTimeToFull(fsdir)
+            if timeToFull == None:
+                timeToFull = float("inf")
+                fullText = "not growing"
+            else:
+                fullText = "full in %.1fh" % (timeToFull / 3600)
+            self.updateAlert("diskfull:%s" % fsdir, timeToFull, fullThresholds,
+                "Disk on host '%s' is filling up: %s %.0f%% used, %s" %
+                (curHost, fsdir, curSpace, fullText))
+
+        # alerts of mount points removed from the config never recover
+        self.retainAlerts(alertKeys)
+
+    # handler for disk usage related commands
+    @command(minArgs=2, maxArgs=3)
+    def handleDiskCommand(self, sender, arguments):
+        """
+        disk history <mount> [<points>]
+
+        Show disk usage history and fill rate of a monitored mount point
+        """
+        if arguments[0] != "history" or \
+                (len(arguments) == 3 and not arguments[2].isdigit()):
+            self.sendMessage(sender,
+                "Usage: %s" % self._getDocForCurrentFunction())
+            return 1
+
+        fsdir = arguments[1]
+        history = self.diskHistory.get(fsdir)
+        if history == None or len(history) == 0:
+            self.sendMessage(sender, "No history for '%s'" % fsdir)
+            return 1
+
+        points = 12
+        if len(arguments) == 3:
+            points = max(1, int(arguments[2]))
+
+        lines = ["Disk usage of '%s':" % fsdir]
+        for timestamp, usedSpace in history.downsample(points):
+            lines.append("%s  %5.1f%%" % (
+                time.strftime("%m-%d %H:%M", time.localtime(timestamp)),
+                usedSpace))
+
+        timeToFull = self._getTimeToFull(fsdir)
+        if timeToFull == None:
+            lines.append("Usage is not growing")
+        else:
+            lines.append("Full in %.1fh at the current fill rate" %
+                (timeToFull / 3600))
+
+        self.sendMessage(sender, "\n".join(lines))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AlertManager - alert states with hysteresis, repeat backoff and
+    recovery notifications
+    Part of the InnoXMPP framework
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from framework.AtomicFile import writeJSONAtomically
+
+# alert states, ordered by severity
+OK = "OK"
+WARN = "WARN"
+CRIT = "CRIT"
+
+logger = logging.getLogger("innoxmpp.AlertManager")
+
+
+class AlertThresholds():
+    """
+    AlertThresholds - raise and clear thresholds for an alert
+
+    An alert is raised when the value reaches the raise threshold and
+    cleared only when it falls below the (lower) clear threshold. If
+    higherIsWorse is False, the comparisons are inverted (e.g. for a
+    remaining time). critRaise/critClear may be None for alerts without
+    a critical level.
+    """
+
+    def __init__(self, warnRaise, warnClear, critRaise=None, critClear=None,
+            higherIsWorse=True):
+        """
+        Designated initializer
+        """
+        self.warnRaise = warnRaise
+        self.warnClear = warnClear
+        self.critRaise = critRaise
+        self.critClear = critClear
+        self.higherIsWorse = higherIsWorse
+
+    def _reaches(self, value, threshold):
+        """
+        check if value is at or beyond threshold
+        """
+        if threshold == None:
+            return False
+        if self.higherIsWorse:
+            return value >= threshold
+        return value <= threshold
+
+    def nextState(self, state, value):
+        """
+        return new state for value given the current state
+        """
+        if self._reaches(value, self.critRaise):
+            return CRIT
+        if state == CRIT and self._reaches(value, self.critClear):
+            return CRIT
+        if self._reaches(value, self.warnRaise):
+            return WARN
+        if state in (WARN, CRIT) and self._reaches(value, self.warnClear):
+            return WARN
+        return OK
+
+
+class AlertManager():
+    """
+    AlertManager - track alert states and decide when to notify
+    """
+
+    def __init__(self, notify, stateFile=None, repeatInterval=300,
+            backoffFactor=2.0, maxRepeatInterval=86400):
+        """
+        Designated initializer
+
+        notify            - called as notify(key, state, message, recovered)
+        stateFile         - JSON file to persist alert states in
+        repeatInterval    - seconds until the first repeated notification
+        backoffFactor     - factor the repeat interval grows with
+        maxRepeatInterval - maximal seconds between two notifications
+        """
+        self.notify = notify
+        self.stateFile = stateFile
+        self.repeatInterval = repeatInterval
+        self.backoffFactor = backoffFactor
+        self.maxRepeatInterval = maxRepeatInterval
+
+        # alert key -> dict with state, since, lastNotified, count, message
+        # only alerts which are not OK are kept
+        self.alerts = {}
+        self.lock = threading.Lock()
+
+    def loadState(self):
+        """
+        load alert states from the state file
+        """
+        if not self.stateFile or not os.path.exists(self.stateFile):
+            return
+        try:
+            with open(self.stateFile) as stateHandle:
+                self.alerts = json.load(stateHandle)
+        except (OSError, ValueError):
+            # a broken state file only costs repeated notifications
+            self.alerts = {}
+
+    def saveState(self):
+        """
+        write alert states to the state file
+        """
+        if not self.stateFile:
+            return
+        writeJSONAtomically(self.stateFile, self.alerts)
+
+    def _persistState(self):
+        """
+        write alert states, a failing write is logged so notifications
+        are still sent
+        """
+        try:
+            self.saveState()
+        except OSError:
+            logger.exception("Writing alert states to %s failed",
+                self.stateFile)
+
+    def _repeatDelay(self, count):
+        """
+        return seconds to wait after the count-th notification
+        """
+        return min(self.maxRepeatInterval,
+            self.repeatInterval * self.backoffFactor ** (count - 1))
+
+    def update(self, key, value, thresholds, message, now=None):
+        """
+        update alert key with a new value and notify if needed
+
+        returns the new state
+        """
+        if now == None:
+            now = time.time()
+
+        with self.lock:
+            alert = self.alerts.get(key)
+            state = alert["state"] if alert != None else OK
+            newState = thresholds.nextState(state, value)
+
+            notification = None
+            if newState == OK:
+                if alert != None:
+                    # send recovery message once and forget the alert
+                    del self.alerts[key]
+                    notification = (key, OK, message, True)
+            elif newState != state:
+                # alert raised or changed its severity, notify right away
+                self.alerts[key] = {"state": newState, "since": now,
+                    "lastNotified": now, "count": 1, "message": message}
+                notification = (key, newState, message, False)
+            else:
+                alert["message"] = message
+                if now - alert["lastNotified"] >= \
+                        self._repeatDelay(alert["count"]):
+                    alert["lastNotified"] = now
+                    alert["count"] += 1
+                    notification = (key, newState, message, False)
+
+            if notification != None:
+                self._persistState()
+
+        if notification != None:
+            self.notify(*notification)
+        return newState
+
+    def retain(self, keys):
+        """
+        drop alerts whose key is not in keys (e.g. of mount points which
+        are no longer monitored), without notification
+        """
+        with self.lock:
+            staleKeys = [key for key in self.alerts if key not in keys]
+            for key in staleKeys:
+                del self.alerts[key]
+            if len(staleKeys) > 0:
+                self._persistState()
+
+    def getAlerts(self):
+        """
+        return list of (key, alert dict) of all active alerts
+        """
+        with self.lock:
+            return sorted((key, dict(alert))
+                for key, alert in self.alerts.items())
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+"""
+    AtomicFile - replace state files atomically, so readers (and the bot
+    after a crash) never see a partly written file
+    Part of the InnoXMPP framework
+"""
+
+import json
+import os
+
+
+def writeFileAtomically(path, text):
+    """
+    write text to path, it is written to '<path>.tmp' first and then
+    renamed over path
+    """
+    temporaryFile = path + ".tmp"
+    with open(temporaryFile, "w") as fileHandle:
+        fileHandle.write(text)
+    os.replace(temporaryFile, path)
+
+
+def writeJSONAtomically(path, data, default=None):
+    """
+    write data as JSON to path, replacing it atomically
+
+    default - called for objects JSON can't serialize (see json.dumps)
+    """
+    writeFileAtomically(path, json.dumps(data, default=default))
@@ -7,47 +7,159 @@
 """
 
 import argparse
+import configparser
+import importlib
 import logging
+import signal
+import threading
+import time
+
+from framework.JobManager import JobManager
+from framework.LogManager import LogManager
+from framework.TaskScheduler import TaskScheduler
 
 
 class BotRunner():
     """
     BotRunner - execute bots and handle command line input
+
+    If several bot classes are passed, all bots run in one process. Each
+    bot keeps its own XMPP connection, the worker pool for jobs and the
+    task scheduler are shared.
     """
 
-    def __init__(self, botclass):
+    def __init__(self, *botclasses):
         """
         Designated initializer
 
-        botclass - bot class that should be executed
+        botclasses - bot classes that should be executed
         """
-        # cache bot class and set the instance up
-        self.botInstance = botclass()
+        # cache bot classes and set the instances up
+        self.botInstances = [botclass() for botclass in botclasses]
+        self.botInstance = self.botInstances[0]
 
-        # set up logging for the bot runner
-        logging.basicConfig(level=logging.DEBUG,
-            format='%(levelname)-8s %(filename)s:%(funcName)s(%(lineno)d) %(message)s')
-        self.logger = logging.getLogger()
+        # set up logging for the bot runner and the XMPP library, the
+        # bots set up their own loggers once their config is read
+        self.logger = LogManager.setUp(level=logging.INFO)
 
         # set up argument parser
         self.parser = argparse.ArgumentParser()
 
-        # get configuration from bot class
-        # add config values to arg parser
+        # get configuration from bot classes
+        # add config values to arg parser, options of several bots
+        # with the same name are added once and apply to all bots
         # TODO: clean this up
-        for key, value in self.botInstance.configoptions.options.items():
-            self.logger.debug("Adding value %s" % key)
-            self.parser.add_argument("--%s" % key,
-                help=value["description"])
+        addedOptions = set()
+        for botInstance in self.botInstances:
+            for key, value in botInstance.configoptions.options.items():
+                if key in addedOptions:
+                    continue
+                addedOptions.add(key)
+                self.logger.debug("Adding value %s", key)
+                self.parser.add_argument("--%s" % key,
+                    help=value["description"])
+
+    @staticmethod
+    def loadBotClasses(configFile, section="BotRunner"):
+        """
+        return bot classes listed in option 'bots' of the given config
+        file section, e.g. 'bots=LinuxBot GitBot'
+        """
+        config = configparser.RawConfigParser()
+        config.read(configFile)
+
+        botclasses = []
+        for name in config.get(section, "bots").split():
+            module = importlib.import_module("bots.%s" % name)
+            botclasses.append(getattr(module, name))
+        return botclasses
 
     def run(self):
         """
-        run the bot instance
+        run the bot instance(s)
         """
         # parse comnmand line arguments
-        arguments = self.parser.parse_args()
+        arguments = vars(self.parser.parse_args())
 
-        self.botInstance.configoptions.processCommandLineArguments(vars(arguments))
+        for botInstance in self.botInstances:
+            try:
+                botInstance.configoptions.processCommandLineArguments(
+                    dict((key, value) for key, value in arguments.items()
+                        if key in botInstance.configoptions.options))
+            except ValueError as e:
+                self.parser.error(str(e))
 
         # run bot class,
-        self.botInstance.run()
+        if len(self.botInstances) == 1:
+            self.runSingleBot()
+        else:
+            self.runMultipleBots()
+
+    def runSingleBot(self):
+        """
+        run the bot instance with its own job manager and scheduler
+        """
+        if self.botInstance.run(block=False):
+            self._waitForBots([self.botInstance])
+            self.botInstance.shutdown()
+
+    def runMultipleBots(self):
+        """
+        run all bot instances in this process with a shared job manager
+        and scheduler
+        """
+        # the shared services use the settings of the first bot
+        self.botInstance.loadConfig()
+        configoptions = self.botInstance.configoptions
+        jobManager = JobManager(configoptions["workers"])
+        scheduler = TaskScheduler(
+            maxWorkers=configoptions["taskworkers"],
+            jitter=configoptions["taskjitter"],
+            logger=self.logger)
+        scheduler.start()
+
+        runningBots = []
+        for botInstance in self.botInstances:
+            self.logger.info("Starting %s", botInstance.__class__.__name__)
+            if botInstance.run(block=False, jobManager=jobManager,
+                    scheduler=scheduler):
+                runningBots.append(botInstance)
+
+        self._waitForBots(runningBots)
+
+        for botInstance in runningBots:
+            botInstance.shutdown()
+        scheduler.stop()
+        jobManager.shutdown()
+
+    def reloadBots(self):
+        """
+        reload the config of all bots, they stay connected
+        """
+        for botInstance in self.botInstances:
+            if botInstance.messageQueue == None:
+                continue
+            self.logger.info("Reloading config of %s",
+                botInstance.__class__.__name__)
+            botInstance.reloadConfig()
+
+    def _waitForBots(self, runningBots):
+        """
+        wait until all bots are disconnected or the host is stopped,
+        SIGHUP reloads the config of the bots
+        """
+        # installed after the XMPP clients are set up, SleekXMPP would
+        # otherwise disconnect on SIGHUP; the reload runs in its own
+        # thread so the signal handler doesn't block
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame:
+                threading.Thread(target=self.reloadBots).start())
+
+        try:
+            while any(not botInstance.stop.is_set()
+                    for botInstance in runningBots):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.logger.info("Stopping all bots")
+            for botInstance in runningBots:
+                botInstance.disconnect()
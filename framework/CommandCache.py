@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+    CommandCache - keep the replies of read-only commands for a short
+    time, so repeated queries don't run the same subprocess again
+    Part of the InnoXMPP framework
+"""
+
+import collections
+import threading
+import time
+
+
+class CachedReplies():
+    """
+    CachedReplies - the replies of one command call
+    """
+
+    def __init__(self, scope, replies, expires):
+        """
+        Designated initializer
+
+        scope   - resource the command worked on (e.g. a repository),
+                  None if it doesn't depend on a single one
+        replies - list of texts sent to the caller
+        expires - timestamp after which the replies are outdated
+        """
+        self.scope = scope
+        self.replies = replies
+        self.expires = expires
+
+
+class ReplyCapture():
+    """
+    ReplyCapture - collect the replies a command sends to its caller,
+    captures of nested commands pass their replies on to the outer one
+    """
+
+    def __init__(self, recipient, parent=None, hold=False):
+        """
+        Designated initializer
+
+        hold - keep the replies instead of sending them (they are sent
+               later as one message)
+        """
+        self.recipient = recipient
+        self.parent = parent
+        self.hold = hold
+        self.replies = []
+        # cleared if the command changed state while running
+        self.cacheable = True
+        # set if a job run as part of the command failed
+        self.failed = False
+
+
+class CommandCache():
+    """
+    CommandCache - bounded cache of command replies with an expiry time,
+    the least recently used entry is dropped first
+    """
+
+    def __init__(self, maxEntries=256):
+        """
+        Designated initializer
+        """
+        self.maxEntries = maxEntries
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """
+        return cached replies for key, None if there are none or
+        they are outdated
+        """
+        if now == None:
+            now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry == None:
+                return None
+            if entry.expires <= now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry.replies
+
+    def put(self, key, scope, replies, ttl, now=None):
+        """
+        cache replies for key for ttl seconds
+        """
+        if now == None:
+            now = time.time()
+        with self.lock:
+            self.entries[key] = CachedReplies(scope, replies, now + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, scope=None):
+        """
+        drop replies of commands on scope and of commands which don't
+        depend on a single scope (e.g. lists of all repositories),
+        drop everything if scope is None
+        """
+        with self.lock:
+            if scope == None:
+                self.entries.clear()
+                return
+            for key in [key for key, entry in self.entries.items()
+                    if entry.scope == None or entry.scope == scope]:
+                del self.entries[key]
+
+    def __len__(self):
+        """
+        return number of cached entries
+        """
+        with self.lock:
+            return len(self.entries)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+    CommandRegistry - collect the command handlers of a bot class once
+    and provide dispatch and help information for them
+    Part of the InnoXMPP framework
+"""
+
+import inspect
+
+
+def command(aliases=(), minArgs=None, maxArgs=None, cacheTTL=None,
+        invalidatesCache=False):
+    """
+    decorator to attach additional command information to a handler
+
+    aliases          - alternative names for the command
+    minArgs          - minimal number of arguments (None: no check)
+    maxArgs          - maximal number of arguments (None: no check)
+    cacheTTL         - seconds the replies of a read-only command are
+                       reused for the same arguments (None: no caching)
+    invalidatesCache - the command changes state, cached replies of
+                       commands on the same resource are dropped
+    """
+    def decorate(function):
+        function.commandInfo = {
+            "aliases": tuple(aliases),
+            "minArgs": minArgs,
+            "maxArgs": maxArgs,
+            "cacheTTL": cacheTTL,
+            "invalidatesCache": invalidatesCache
+        }
+        return function
+    return decorate
+
+
+def splitCommands(text):
+    """
+    split message text into commands separated by newlines or '&&'
+
+    '&&' inside a quoted argument (a quote at the start of a word up to
+    the matching quote) doesn't separate commands, empty commands are
+    dropped
+    """
+    commands = []
+    current = []
+    quote = None
+    index = 0
+    while index < len(text):
+        character = text[index]
+        if character == "\n":
+            # a line always ends a command, even with an open quote
+            commands.append("".join(current))
+            current = []
+            quote = None
+            index += 1
+            continue
+
+        if quote != None:
+            if character == quote:
+                quote = None
+        elif character in "\"'" and (index == 0 or text[index - 1].isspace()):
+            quote = character
+        elif text.startswith("&&", index):
+            commands.append("".join(current))
+            current = []
+            index += 2
+            continue
+
+        current.append(character)
+        index += 1
+
+    commands.append("".join(current))
+    return [command.strip() for command in commands if command.strip() != ""]
+
+
+class Command():
+    """
+    Command - information about a single command handler
+    """
+
+    def __init__(self, name, handlerName, doc, aliases=(), minArgs=None,
+            maxArgs=None, cacheTTL=None, invalidatesCache=False):
+        """
+        Designated initializer
+        """
+        self.name = name
+        self.handlerName = handlerName
+        self.aliases = aliases
+        self.minArgs = minArgs
+        self.maxArgs = maxArgs
+        self.cacheTTL = cacheTTL
+        self.invalidatesCache = invalidatesCache
+
+        # pre-render the texts used for 'help' and usage replies,
+        # the first paragraph of the docstring is the usage line
+        self.doc = doc
+        self.usage = doc.split("\n\n")[0]
+        self.helpLine = doc.replace("\n\n", " - ")
+        if len(aliases) > 0:
+            self.helpLine += " (alias: %s)" % ", ".join(aliases)
+
+    def acceptsArguments(self, arguments):
+        """
+        check if number of arguments matches the command arity
+        """
+        if self.minArgs != None and len(arguments) < self.minArgs:
+            return False
+        if self.maxArgs != None and len(arguments) > self.maxArgs:
+            return False
+        return True
+
+
+class CommandRegistry():
+    """
+    CommandRegistry - all commands of a bot class, built once per class
+    """
+
+    @classmethod
+    def forClass(cls, botclass):
+        """
+        return registry for given bot class, build it on first access
+        """
+        # look at the class dict only, subclasses need their own registry
+        registry = botclass.__dict__.get("_commandRegistry")
+        if registry == None:
+            registry = cls(botclass)
+            botclass._commandRegistry = registry
+        return registry
+
+    def __init__(self, botclass):
+        """
+        Designated initializer
+
+        Raises ValueError if a handler is invalid (e.g. has no docstring)
+        """
+        self.commands = {}
+        self.handlers = {}
+
+        for handlerName, function in inspect.getmembers(botclass,
+                inspect.isfunction):
+            # only command handlers are of interest
+            if not (handlerName.startswith("handle") and
+                    handlerName.endswith("Command")):
+                continue
+
+            name = handlerName[len("handle"):-len("Command")].lower()
+            if name == "":
+                continue
+
+            doc = inspect.getdoc(function)
+            if not doc:
+                raise ValueError("Command handler %s.%s has no docstring" %
+                    (botclass.__name__, handlerName))
+
+            info = getattr(function, "commandInfo", {})
+            commandEntry = Command(name, handlerName, doc, **info)
+            self.handlers[handlerName] = commandEntry
+            self._register(botclass, name, commandEntry)
+            for alias in commandEntry.aliases:
+                self._register(botclass, alias.lower(), commandEntry)
+
+        # pre-render the complete help text, sorted by handler name
+        self.helpText = "Help for %s\n\n%s" % (botclass.__name__,
+            "\n".join(self.handlers[handlerName].helpLine
+                for handlerName in sorted(self.handlers)))
+
+    def _register(self, botclass, name, commandEntry):
+        """
+        add command name to lookup table, reject duplicates
+        """
+        if name in self.commands:
+            raise ValueError("Command '%s' of %s is defined twice" %
+                (name, botclass.__name__))
+        self.commands[name] = commandEntry
+
+    def lookup(self, name):
+        """
+        return command for given name or alias (None if unknown)
+        """
+        return self.commands.get(name.lower())
+
+    def getByHandlerName(self, handlerName):
+        """
+        return command for given handler function name
+        """
+        return self.handlers.get(handlerName)
+
+    def bind(self, bot):
+        """
+        return dict mapping command names to bound handlers of bot
+        """
+        return dict((name, getattr(bot, commandEntry.handlerName))
+            for name, commandEntry in self.commands.items())
@@ -5,6 +5,46 @@
 """
 
 import configparser
+import difflib
+
+
+def _parseBool(value):
+    """
+    return boolean for values like '1', 'yes', 'true', 'on' (and their
+    negative counterparts)
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return value != 0
+    text = str(value).strip().lower()
+    if text in ("1", "yes", "true", "on"):
+        return True
+    if text in ("0", "no", "false", "off"):
+        return False
+    raise ValueError("'%s' is not a boolean" % value)
+
+
+def _parseList(value):
+    """
+    return list of items (e.g. paths) from a whitespace separated string
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return str(value).split()
+
+
+# converters for the option types, they accept the default values and
+# the strings read from the config file or the command line
+OPTION_TYPES = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _parseBool,
+    "list": _parseList,
+    "pathlist": _parseList,
+    "enum": str
+}
 
 
 class ConfigOptions():
@@ -15,14 +55,53 @@ class ConfigOptions():
         """
         self.options = {}
 
-    def addConfigOption(self, name, value, description):
+    def addConfigOption(self, name, value, description, optionType="str",
+            choices=None, needsRestart=False):
         """
         add option to config dictionary
-        """
+
+        optionType   - one of str, int, float, bool, list, pathlist or enum,
+                       values are converted once when they are set
+        choices      - allowed values of enum options
+        needsRestart - changes only take effect after a restart of the
+                       bot (e.g. the XMPP credentials)
+        """
+        if optionType not in OPTION_TYPES:
+            raise ValueError("Unknown type '%s' of option '%s'" %
+                (optionType, name))
+        if optionType == "enum" and not choices:
+            raise ValueError("Enum option '%s' needs choices" % name)
+
         self.options[name] = {
-            "value": value,
-            "description": description
+            "value": None,
+            "description": description,
+            "type": optionType,
+            "choices": choices,
+            "needsRestart": needsRestart
         }
+        self.setConfigValue(name, value)
+
+    def convertValue(self, name, value):
+        """
+        return value converted to the type of option name, raises
+        ValueError if it can't be converted
+        """
+        option = self.options[name]
+        try:
+            converted = OPTION_TYPES[option["type"]](value)
+        except ValueError:
+            raise ValueError("Invalid value '%s' for option '%s' (%s expected)" %
+                (value, name, option["type"]))
+
+        if option["type"] == "enum":
+            # enum values are matched case insensitive
+            for choice in option["choices"]:
+                if choice.lower() == converted.strip().lower():
+                    return choice
+            raise ValueError("Invalid value '%s' for option '%s', one of %s expected" %
+                (value, name, ", ".join(option["choices"])))
+
+        return converted
 
     def getConfigValue(self, name):
         """
@@ -48,10 +127,9 @@ class ConfigOptions():
 
     def setConfigValue(self, name, value):
         """
-        overload special method to provide direct access to items via dict
-        syntax
+        set value of config item, converted to the type of the option
         """
-        self.options[name]["value"] = value
+        self.options[name]["value"] = self.convertValue(name, value)
 
     def processCommandLineArguments(self, arguments):
         """
@@ -61,15 +139,68 @@ class ConfigOptions():
         for name, value in arguments.items():
             if value != None:
                 self.setConfigValue(name, value)
+                # command line values win over the config file
+                self.options[name]["commandLine"] = True
 
     def parseConfig(self, classname, config):
         """
         process configparser arguments
-        """
-        for key in self.options.keys():
+
+        All values are validated before any of them is set. Raises
+        ValueError listing all invalid values, returns a list of
+        warnings about unknown keys in the section of the bot.
+        """
+        values = {}
+        errors = []
+        for key, option in self.options.items():
+            if option.get("commandLine"):
+                continue
             try:
-                value = config.get(classname, key)
-                self.setConfigValue(key, value)
-            except configparser.NoOptionError:
+                values[key] = self.convertValue(key, config.get(classname, key))
+            except (configparser.NoOptionError, configparser.NoSectionError):
                 # ignore options that are not set in the config file
                 pass
+            except ValueError as e:
+                errors.append(str(e))
+
+        if len(errors) > 0:
+            raise ValueError("\n".join(errors))
+
+        for key, value in values.items():
+            self.options[key]["value"] = value
+
+        return self.findUnknownKeys(classname, config)
+
+    def findUnknownKeys(self, classname, config):
+        """
+        return warnings about keys in the section of the bot which are
+        no config options, with suggestions for misspelled ones
+        """
+        warnings = []
+        if not config.has_section(classname):
+            return warnings
+
+        for key in config.options(classname):
+            if key in self.options:
+                continue
+            matches = difflib.get_close_matches(key, self.options.keys(), 1)
+            if len(matches) > 0:
+                warnings.append("Unknown option '%s' in section [%s], did you mean '%s'?" %
+                    (key, classname, matches[0]))
+            else:
+                warnings.append("Unknown option '%s' in section [%s]" %
+                    (key, classname))
+        return warnings
+
+    def getValues(self):
+        """
+        return dict of all option names and their values
+        """
+        return dict((name, option["value"]) for name, option in
+            self.options.items())
+
+    def needsRestart(self, name):
+        """
+        return True if changes of option name need a restart of the bot
+        """
+        return self.options[name]["needsRestart"]
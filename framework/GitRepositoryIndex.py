@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""
+    GitRepositoryIndex - in-memory index of the git clones in a directory
+    Part of the InnoXMPP framework
+"""
+
+import os
+import threading
+import time
+
+# pyinotify is optional, without it the index relies on periodic rescans
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+def readHead(path):
+    """
+    return current branch and HEAD commit of the clone in path,
+    branch is None for a detached HEAD
+    """
+    gitPath = os.path.join(path, ".git")
+    try:
+        with open(os.path.join(gitPath, "HEAD")) as headFile:
+            head = headFile.read().strip()
+    except (OSError, IOError):
+        return None, None
+
+    # detached HEAD contains the commit itself
+    if not head.startswith("ref: "):
+        return None, head
+
+    ref = head[len("ref: "):]
+    branch = ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+
+    # resolve the ref, either as a loose ref or from packed-refs
+    try:
+        with open(os.path.join(gitPath, ref)) as refFile:
+            return branch, refFile.read().strip()
+    except (OSError, IOError):
+        pass
+
+    try:
+        with open(os.path.join(gitPath, "packed-refs")) as packedFile:
+            for line in packedFile:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return branch, parts[0]
+    except (OSError, IOError):
+        pass
+
+    # unborn branch (e.g. empty repository)
+    return branch, None
+
+
+class RepositoryInfo():
+    """
+    RepositoryInfo - index entry for a single clone
+    """
+
+    def __init__(self, name, path):
+        """
+        Designated initializer
+        """
+        self.name = name
+        self.path = path
+        self.branch, self.head = readHead(path)
+
+
+class GitRepositoryIndex():
+    """
+    GitRepositoryIndex - map clone names to clone information
+    """
+
+    def __init__(self, gitdir):
+        """
+        Designated initializer
+
+        gitdir - directory containing the clones
+        """
+        self.gitdir = gitdir
+        self.repositories = {}
+        self.exists = False
+        self.lock = threading.Lock()
+        self.notifier = None
+
+    def rescan(self):
+        """
+        rebuild the index from the clone directory
+        """
+        repositories = {}
+        exists = os.path.isdir(self.gitdir)
+
+        if exists:
+            for entry in os.scandir(self.gitdir):
+                if entry.is_dir() and \
+                        os.path.exists(os.path.join(entry.path, ".git")):
+                    repositories[entry.name] = \
+                        RepositoryInfo(entry.name, entry.path)
+
+        with self.lock:
+            self.repositories = repositories
+            self.exists = exists
+
+    def refresh(self, name):
+        """
+        update index entry for a single clone (e.g. after a checkout)
+        """
+        # ignore names that don't denote a direct subdirectory
+        if name in ("", ".", "..") or os.sep in name:
+            return
+
+        path = os.path.join(self.gitdir, name)
+        with self.lock:
+            if os.path.exists(os.path.join(path, ".git")):
+                self.repositories[name] = RepositoryInfo(name, path)
+            else:
+                self.repositories.pop(name, None)
+
+    def get(self, name):
+        """
+        return index entry for clone name (None if there is no such clone)
+        """
+        return self.repositories.get(name)
+
+    def names(self):
+        """
+        return sorted list of all clone names
+        """
+        return sorted(self.repositories)
+
+    def startWatching(self):
+        """
+        keep the index up to date using inotify on the clone directory
+
+        returns False if inotify isn't available
+        """
+        if pyinotify == None or not self.exists:
+            return False
+
+        index = self
+
+        # a clone created by 'git clone' shows up before its .git
+        # directory exists, such clones are picked up by an explicit
+        # refresh or the next rescan; moved and deleted clones are
+        # updated right away
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                index.refresh(event.name)
+
+        watchManager = pyinotify.WatchManager()
+        self.notifier = pyinotify.ThreadedNotifier(watchManager, EventHandler())
+        self.notifier.daemon = True
+        self.notifier.start()
+        watchManager.add_watch(self.gitdir,
+            pyinotify.IN_CREATE | pyinotify.IN_DELETE |
+            pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO |
+            pyinotify.IN_ONLYDIR)
+        return True
+
+    def stopWatching(self):
+        """
+        stop inotify watching
+        """
+        if self.notifier != None:
+            self.notifier.stop()
+            self.notifier = None
+
+
+class RepositoryStatus():
+    """
+    RepositoryStatus - cached result of the background fetch for a clone
+    """
+
+    def __init__(self, ahead, behind, dirty, lastCommit, upstreamHead):
+        """
+        Designated initializer
+
+        ahead, behind - commits ahead of/behind upstream (None if the
+                        current branch has no upstream)
+        """
+        self.ahead = ahead
+        self.behind = behind
+        self.dirty = dirty
+        self.lastCommit = lastCommit
+        self.upstreamHead = upstreamHead
+        self.updated = time.time()
+
+    def describe(self):
+        """
+        return short text describing the status
+        """
+        if self.ahead == None:
+            tracking = "no upstream"
+        elif self.ahead == 0 and self.behind == 0:
+            tracking = "up to date"
+        else:
+            tracking = "+%d/-%d" % (self.ahead, self.behind)
+
+        if self.dirty:
+            tracking += ", dirty"
+
+        return "%s (%s)" % (tracking, self.lastCommit)
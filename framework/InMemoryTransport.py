@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+    InMemoryTransport - stand-in for the network layer of
+    sleekxmpp.ClientXMPP, used to benchmark bots without an XMPP server
+    Part of the InnoXMPP framework
+"""
+
+import threading
+import time
+
+import sleekxmpp
+
+
+class InMemoryTransport():
+    """
+    InMemoryTransport - mixin replacing connection handling and stanza
+    sending of a bot, combine it with a bot class like
+
+        class BenchmarkGitBot(InMemoryTransport, GitBot):
+            pass
+
+    Outgoing messages are collected in self.outbox as
+    (timestamp, recipient, body) tuples.
+    """
+
+    def connect(self, *args, **kwargs):
+        """
+        pretend to connect to the XMPP server
+        """
+        self.outbox = []
+        self.outboxCondition = threading.Condition()
+        return True
+
+    def process(self, *args, **kwargs):
+        """
+        there are no stanzas to process, messages are injected by deliver()
+        """
+        pass
+
+    def disconnect(self, *args, **kwargs):
+        """
+        pretend to disconnect
+        """
+        self.stop.set()
+
+    def send_presence(self, *args, **kwargs):
+        pass
+
+    def get_roster(self, *args, **kwargs):
+        pass
+
+    def send_message(self, mto, mbody, mtype="chat", **kwargs):
+        """
+        collect outgoing message in the outbox
+        """
+        with self.outboxCondition:
+            self.outbox.append((time.time(), str(mto), mbody))
+            self.outboxCondition.notify_all()
+
+    def deliver(self, body, sender="admin@example.com/benchmark", mtype="chat"):
+        """
+        handle incoming message as if it was received from the server
+        """
+        message = {
+            "type": mtype,
+            "body": body,
+            "from": sleekxmpp.jid.JID(sender)
+        }
+        self.handleMessage(message)
+
+    def waitForMessage(self, startIndex, predicate=None, timeout=60):
+        """
+        wait until a message at or after outbox index startIndex matches
+        predicate(body) (any message if None)
+
+        returns (timestamp, recipient, body) or None on timeout
+        """
+        deadline = time.time() + timeout
+        index = startIndex
+        with self.outboxCondition:
+            while True:
+                while index < len(self.outbox):
+                    entry = self.outbox[index]
+                    index += 1
+                    if predicate == None or predicate(entry[2]):
+                        return entry
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.outboxCondition.wait(remaining)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+    JobManager - run long-running bot work asynchronously in a bounded
+    worker pool and keep track of it by job ID
+    Part of the InnoXMPP framework
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger("innoxmpp.JobManager")
+
+
+class Job():
+    """
+    Job - a single unit of work handled by the JobManager
+    """
+
+    def __init__(self, jobID, description, sender, owner=None):
+        """
+        Designated initializer
+        """
+        self.jobID = jobID
+        self.owner = owner
+        self.description = description
+        self.sender = sender
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+        # the future returned by the executor and the running child
+        # processes (several for multi-repository jobs), both are needed
+        # to cancel the job
+        self.future = None
+        self.processes = set()
+        self.processLock = threading.Lock()
+
+        self.cancelled = False
+
+    def addProcess(self, process):
+        """
+        register running child process, it is terminated right away
+        if the job has been cancelled meanwhile
+        """
+        with self.processLock:
+            self.processes.add(process)
+            cancelled = self.cancelled
+        if cancelled:
+            process.terminate()
+
+    def removeProcess(self, process):
+        """
+        forget finished child process
+        """
+        with self.processLock:
+            self.processes.discard(process)
+
+    def terminateProcesses(self):
+        """
+        mark job as cancelled and terminate all its child processes
+        """
+        with self.processLock:
+            self.cancelled = True
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() == None:
+                process.terminate()
+
+    def runtime(self):
+        """
+        return runtime of the job in seconds (up to now if still running)
+        """
+        if self.started == None:
+            return 0.0
+        end = self.finished if self.finished != None else time.time()
+        return end - self.started
+
+
+class JobManager():
+    """
+    JobManager - submit, list and cancel asynchronous jobs
+    """
+
+    def __init__(self, maxWorkers=4):
+        """
+        Designated initializer
+
+        maxWorkers - number of jobs that may run in parallel
+        """
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.jobCounter = itertools.count(1)
+
+    def submit(self, description, sender, function, callback=None,
+            owner=None, inline=False, errorCallback=None):
+        """
+        run function(job) in the worker pool and return the new job ID
+
+        callback(job, result) is called in the worker thread when the
+        function returned, unless the job has been cancelled; owner
+        distinguishes jobs of several bots sharing the job manager. If
+        the function raised, the traceback is logged and
+        errorCallback(job, error) is called instead. If inline is set,
+        the job runs in the calling thread and submit() returns when it
+        has finished.
+        """
+        with self.lock:
+            job = Job(next(self.jobCounter), description, sender, owner)
+            self.jobs[job.jobID] = job
+
+        def runJob():
+            if job.cancelled:
+                return None
+            job.state = "running"
+            job.started = time.time()
+            failure = None
+            try:
+                result = function(job)
+            except Exception as error:
+                # nobody reads the future, so the error is handled here
+                job.state = "failed"
+                logger.exception("Job %d (%s) failed", job.jobID,
+                    job.description)
+                failure = error
+            finally:
+                job.finished = time.time()
+                job.processes.clear()
+                self._forgetJob(job)
+
+            if failure != None:
+                if errorCallback != None:
+                    errorCallback(job, failure)
+                return None
+
+            if job.cancelled:
+                job.state = "cancelled"
+                return None
+
+            job.state = "done"
+            if callback != None:
+                callback(job, result)
+            return result
+
+        if inline:
+            runJob()
+        else:
+            job.future = self.executor.submit(runJob)
+        return job.jobID
+
+    def _forgetJob(self, job):
+        """
+        remove finished job from the job list
+        """
+        with self.lock:
+            self.jobs.pop(job.jobID, None)
+
+    def getJobs(self, owner=None):
+        """
+        return list of all queued and running jobs of owner (of all
+        owners if None) ordered by job ID
+        """
+        with self.lock:
+            return [self.jobs[jobID] for jobID in sorted(self.jobs)
+                if owner == None or self.jobs[jobID].owner == owner]
+
+    def cancel(self, jobID, owner=None):
+        """
+        cancel job with given ID, terminate its child processes if it
+        is already running
+
+        returns True if the job was found (and belongs to owner)
+        """
+        with self.lock:
+            job = self.jobs.get(jobID)
+        if job == None or (owner != None and job.owner != owner):
+            return False
+
+        job.cancelled = True
+        job.state = "cancelled"
+
+        # job hasn't started yet, the executor can drop it directly
+        if job.future != None and job.future.cancel():
+            self._forgetJob(job)
+            return True
+
+        job.terminateProcesses()
+        return True
+
+    def shutdown(self):
+        """
+        cancel all jobs and stop the worker pool
+        """
+        for job in self.getJobs():
+            self.cancel(job.jobID)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+    LogManager - asynchronous logging, records are handed to a queue and
+    written to stderr or a rotating log file by a background thread
+    Part of the InnoXMPP framework
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+
+
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(name)s %(filename)s:%(funcName)s(%(lineno)d) %(message)s'
+
+
+def parseLogLevel(value):
+    """
+    return numeric loglevel for a level name (e.g. 'DEBUG') or number
+    """
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise ValueError("Invalid loglevel '%s'" % value)
+    return level
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler which leaves formatting of the message to the listener
+    thread (the default implementation formats on the logging thread)
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LogManager():
+    """
+    LogManager - set up loggers which write their records asynchronously
+
+    Every logger set up here gets its own queue and listener thread, so
+    each bot can use its own loglevel and log file. Pending records are
+    written when the process exits.
+    """
+
+    # logger name -> (queue handler, queue listener)
+    _pipelines = {}
+    _lock = threading.Lock()
+    _atexitRegistered = False
+
+    @classmethod
+    def setUp(cls, name=None, level=logging.INFO, logFile="",
+            maxBytes=10485760, backupCount=5):
+        """
+        set up logger name (the root logger if None) and return it,
+        a previous setup of the same logger is replaced
+
+        logFile     - file to write to (stderr if empty), it is rotated
+                      after maxBytes bytes keeping backupCount old files
+        """
+        if logFile:
+            handler = logging.handlers.RotatingFileHandler(logFile,
+                maxBytes=int(maxBytes), backupCount=int(backupCount))
+        else:
+            handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        logQueue = queue.Queue()
+        queueHandler = _DeferredQueueHandler(logQueue)
+        listener = logging.handlers.QueueListener(logQueue, handler)
+
+        logger = logging.getLogger(name)
+        with cls._lock:
+            oldPipeline = cls._pipelines.pop(name, None)
+            if oldPipeline != None:
+                logger.removeHandler(oldPipeline[0])
+                oldPipeline[1].stop()
+
+            logger.addHandler(queueHandler)
+            logger.setLevel(parseLogLevel(level))
+            # named loggers write to their own destination only
+            if name != None:
+                logger.propagate = False
+
+            listener.start()
+            cls._pipelines[name] = (queueHandler, listener)
+
+            if not cls._atexitRegistered:
+                atexit.register(cls.shutdown)
+                cls._atexitRegistered = True
+
+        return logger
+
+    @classmethod
+    def shutdown(cls):
+        """
+        write all pending records and stop the listener threads
+        """
+        with cls._lock:
+            for name, (queueHandler, listener) in list(cls._pipelines.items()):
+                logging.getLogger(name).removeHandler(queueHandler)
+                listener.stop()
+            cls._pipelines.clear()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""
+    LogTailer - follow log files incrementally and remember the read
+    offsets across restarts
+    Part of the InnoXMPP framework
+"""
+
+import json
+import logging
+import os
+import threading
+
+from framework.AtomicFile import writeJSONAtomically
+
+# pyinotify is optional, without it the log files are polled
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+logger = logging.getLogger("innoxmpp.LogTailer")
+
+
+class TailedFile():
+    """
+    TailedFile - read position in a single log file
+    """
+
+    def __init__(self, path):
+        """
+        Designated initializer
+        """
+        self.path = path
+        self.handle = None
+        self.inode = None
+        self.offset = 0
+        # incomplete last line, completed by the next read
+        self.partial = b""
+        # last error reading the file, logged once until it changes
+        self.error = None
+
+    def open(self, offset):
+        """
+        (re)open the file and continue reading at offset
+        """
+        self.close()
+        self.handle = open(self.path, "rb")
+        self.inode = os.fstat(self.handle.fileno()).st_ino
+        self.offset = offset
+        self.handle.seek(offset)
+        self.partial = b""
+
+    def close(self):
+        """
+        close the file
+        """
+        if self.handle != None:
+            self.handle.close()
+            self.handle = None
+
+    def readLines(self, chunkSize=65536):
+        """
+        return complete lines appended since the last read
+        """
+        lines = []
+        while True:
+            chunk = self.handle.read(chunkSize)
+            if len(chunk) == 0:
+                break
+            self.offset += len(chunk)
+            parts = (self.partial + chunk).split(b"\n")
+            self.partial = parts.pop()
+            lines.extend(part.decode("utf-8", "replace") for part in parts)
+        return lines
+
+
+class LogTailer():
+    """
+    LogTailer - follow log files and pass new lines to a callback
+    """
+
+    def __init__(self, paths, lineCallback, stateFile=None, pollInterval=5,
+            backlog=1048576):
+        """
+        Designated initializer
+
+        paths        - log files to follow
+        lineCallback - called as lineCallback(path, line) for new lines
+        stateFile    - JSON file to persist offsets in (None: don't persist)
+        pollInterval - seconds between two checks without inotify events
+        backlog      - bytes read from the end of a file seen the first time
+        """
+        self.files = dict((path, TailedFile(path)) for path in paths)
+        self.lineCallback = lineCallback
+        self.stateFile = stateFile
+        self.pollInterval = pollInterval
+        self.backlog = backlog
+
+        # additional data persisted together with the offsets
+        self.userData = {}
+
+        self.savedOffsets = {}
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.notifier = None
+
+    def loadState(self):
+        """
+        load offsets and user data from the state file
+        """
+        if self.stateFile == None or not os.path.exists(self.stateFile):
+            return
+        try:
+            with open(self.stateFile) as stateHandle:
+                state = json.load(stateHandle)
+            savedOffsets = state.get("offsets", {})
+            userData = state.get("data", {})
+        except (OSError, ValueError, AttributeError):
+            # files are read like the first time (only the backlog)
+            return
+        self.savedOffsets = savedOffsets
+        self.userData = userData
+
+    def saveState(self):
+        """
+        write offsets and user data to the state file
+        """
+        if self.stateFile == None:
+            return
+
+        offsets = {}
+        for path, tailedFile in self.files.items():
+            if tailedFile.handle != None:
+                # don't count the incomplete line as read
+                offsets[path] = {"inode": tailedFile.inode,
+                    "offset": tailedFile.offset - len(tailedFile.partial)}
+
+        writeJSONAtomically(self.stateFile,
+            {"offsets": offsets, "data": self.userData})
+
+    def _openFile(self, tailedFile, stat):
+        """
+        open a file for the first time, continue at the saved offset if
+        the file is still the same, else only read the backlog
+        """
+        saved = self.savedOffsets.get(tailedFile.path)
+        if saved != None and saved["inode"] == stat.st_ino and \
+                saved["offset"] <= stat.st_size:
+            tailedFile.open(saved["offset"])
+            return
+
+        offset = max(0, stat.st_size - self.backlog)
+        tailedFile.open(offset)
+        # skip the incomplete first line when starting in the middle
+        if offset > 0:
+            tailedFile.offset += len(tailedFile.handle.readline())
+
+    def poll(self):
+        """
+        read new lines of all files, handle rotation and truncation
+
+        returns the number of lines read
+        """
+        lineCount = 0
+        for path, tailedFile in self.files.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # file is missing (e.g. during rotation), try again later
+                continue
+
+            # one unreadable file mustn't stop following the others,
+            # it is tried again on the next poll
+            try:
+                lines = self._readFile(tailedFile, stat)
+            except Exception as error:
+                if str(error) != tailedFile.error:
+                    logger.exception("Reading %s failed", path)
+                    tailedFile.error = str(error)
+                continue
+            tailedFile.error = None
+
+            for line in lines:
+                try:
+                    self.lineCallback(path, line)
+                except Exception:
+                    logger.exception("Processing line of %s failed", path)
+            lineCount += len(lines)
+
+        if lineCount > 0:
+            try:
+                self.saveState()
+            except OSError:
+                logger.exception("Writing state to %s failed", self.stateFile)
+        return lineCount
+
+    def _readFile(self, tailedFile, stat):
+        """
+        return new lines of a file, handle rotation and truncation
+        """
+        lines = []
+        if tailedFile.handle == None:
+            self._openFile(tailedFile, stat)
+        elif stat.st_ino != tailedFile.inode:
+            # file was rotated, finish the old file and start over
+            lines.extend(tailedFile.readLines())
+            tailedFile.open(0)
+        elif stat.st_size < tailedFile.offset:
+            # file was truncated
+            tailedFile.open(0)
+
+        lines.extend(tailedFile.readLines())
+        return lines
+
+    def _startInotify(self):
+        """
+        wake up the tailing thread on changes in the log directories
+        """
+        if pyinotify == None:
+            return False
+
+        tailer = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                if event.pathname in tailer.files:
+                    tailer.wakeup.set()
+
+        watchManager = pyinotify.WatchManager()
+        self.notifier = pyinotify.ThreadedNotifier(watchManager, EventHandler())
+        self.notifier.daemon = True
+        self.notifier.start()
+
+        # watch the directories to notice rotated files as well
+        for directory in set(os.path.dirname(path) for path in self.files):
+            watchManager.add_watch(directory,
+                pyinotify.IN_MODIFY | pyinotify.IN_CREATE |
+                pyinotify.IN_MOVED_TO)
+        return True
+
+    def start(self):
+        """
+        start following the files in a background thread
+
+        returns False if inotify is not available and files are polled
+        """
+        self.loadState()
+        self.running = True
+        usesInotify = self._startInotify()
+
+        self.thread = threading.Thread(target=self._run, name="LogTailer")
+        self.thread.daemon = True
+        self.thread.start()
+        return usesInotify
+
+    def stop(self):
+        """
+        stop following the files
+        """
+        self.running = False
+        self.wakeup.set()
+        if self.notifier != None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        for tailedFile in self.files.values():
+            tailedFile.close()
+
+    def _run(self):
+        """
+        tailing thread main loop
+        """
+        while self.running:
+            self.poll()
+            # inotify events wake the thread early, the timeout is
+            # the polling fallback
+            self.wakeup.wait(self.pollInterval)
+            self.wakeup.clear()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+    MessageQueue - outbound message queue which merges messages to the
+    same recipient and rate limits sending
+    Part of the InnoXMPP framework
+"""
+
+import collections
+import threading
+import time
+
+
+class TokenBucket():
+    """
+    TokenBucket - simple token bucket rate limiter
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Designated initializer
+
+        rate  - tokens added per second
+        burst - maximum number of tokens
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def _refill(self, now):
+        """
+        add tokens for the time passed since the last update
+        """
+        self.tokens = min(self.burst,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        return seconds until a token is available (0 if available now)
+        """
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        """
+        take a token from the bucket
+        """
+        self._refill(now)
+        self.tokens -= 1
+
+    def isFull(self, now):
+        """
+        check if the bucket is completely refilled
+        """
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class PendingMessages():
+    """
+    PendingMessages - messages waiting to be sent to a single recipient
+    """
+
+    def __init__(self, recipient, now):
+        """
+        Designated initializer
+        """
+        self.recipient = recipient
+        self.texts = collections.deque()
+        self.firstQueued = now
+
+    def takeText(self, maxLength):
+        """
+        remove and return queued texts merged to one text,
+        the merged text doesn't exceed maxLength if possible
+        """
+        texts = [self.texts.popleft()]
+        length = len(texts[0])
+        while len(self.texts) > 0:
+            nextLength = length + 1 + len(self.texts[0])
+            if maxLength != None and nextLength > maxLength:
+                break
+            texts.append(self.texts.popleft())
+            length = nextLength
+        return "\n".join(texts)
+
+
+class MessageQueue():
+    """
+    MessageQueue - merge and rate limit outgoing messages in a
+    background thread
+    """
+
+    def __init__(self, sendFunction, window=0.5, rate=1.0, burst=5,
+            globalRate=10.0, globalBurst=20, maxLength=None):
+        """
+        Designated initializer
+
+        sendFunction - called as sendFunction(recipient, text) to send
+        window       - seconds to wait for further messages to merge
+        rate, burst  - token bucket settings per recipient
+        globalRate, globalBurst - token bucket settings for all messages
+        maxLength    - maximal length of a merged message
+        """
+        self.sendFunction = sendFunction
+
+        self.pending = collections.OrderedDict()
+        self.buckets = {}
+        self.queued = 0
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.paused = False
+        self.thread = None
+
+        self.configure(window, rate, burst, globalRate, globalBurst, maxLength)
+
+    def configure(self, window=0.5, rate=1.0, burst=5, globalRate=10.0,
+            globalBurst=20, maxLength=None):
+        """
+        change merging window, rate limits and max. message length,
+        queued messages are kept
+        """
+        with self.condition:
+            self.window = float(window)
+            self.rate = float(rate)
+            self.burst = float(burst)
+            self.globalBucket = TokenBucket(globalRate, globalBurst)
+            self.maxLength = maxLength
+            # buckets are created again with the new settings
+            self.buckets = {}
+            self.condition.notify()
+
+    def put(self, recipient, text):
+        """
+        queue text for recipient
+        """
+        with self.condition:
+            key = str(recipient)
+            entry = self.pending.get(key)
+            if entry == None:
+                entry = PendingMessages(recipient, time.time())
+                self.pending[key] = entry
+            entry.texts.append(text)
+            self.queued += 1
+            self.condition.notify()
+
+    def depth(self):
+        """
+        return number of messages waiting to be sent
+        """
+        with self.condition:
+            return self.queued
+
+    def start(self):
+        """
+        start the sending thread
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self._run,
+            name="MessageQueue")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def pause(self):
+        """
+        hold messages back (e.g. while disconnected), they are still
+        queued and merged
+        """
+        with self.condition:
+            self.paused = True
+
+    def resume(self):
+        """
+        send held back messages again
+        """
+        with self.condition:
+            self.paused = False
+            self.condition.notify()
+
+    def stop(self):
+        """
+        stop the sending thread after sending everything that is queued
+        (messages held back by pause() are dropped)
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+
+    def _takeReadyMessages(self, now):
+        """
+        collect messages that may be sent now
+
+        returns list of (recipient, text) and the seconds to wait
+        until the next message may be ready (None if nothing is queued)
+        """
+        messages = []
+        wait = None
+
+        for key, entry in list(self.pending.items()):
+            # wait for further messages to merge (unless shutting down)
+            readyAt = entry.firstQueued + self.window
+            if self.running and now < readyAt:
+                wait = readyAt - now if wait == None else min(wait, readyAt - now)
+                continue
+
+            bucket = self.buckets.get(key)
+            if bucket == None:
+                bucket = TokenBucket(self.rate, self.burst)
+                self.buckets[key] = bucket
+
+            delay = max(bucket.delay(now), self.globalBucket.delay(now))
+            if delay > 0:
+                wait = delay if wait == None else min(wait, delay)
+                continue
+
+            bucket.consume(now)
+            self.globalBucket.consume(now)
+
+            mergedCount = len(entry.texts)
+            messages.append((entry.recipient, entry.takeText(self.maxLength)))
+            self.queued -= mergedCount - len(entry.texts)
+
+            if len(entry.texts) == 0:
+                del self.pending[key]
+            else:
+                entry.firstQueued = now
+
+        # forget buckets of idle recipients
+        for key in [key for key, bucket in self.buckets.items()
+                if key not in self.pending and bucket.isFull(now)]:
+            del self.buckets[key]
+
+        return messages, wait
+
+    def _run(self):
+        """
+        sending thread main loop
+        """
+        while True:
+            with self.condition:
+                if self.paused:
+                    if not self.running:
+                        return
+                    self.condition.wait()
+                    continue
+
+                messages, wait = self._takeReadyMessages(time.time())
+                if len(messages) == 0:
+                    if not self.running and len(self.pending) == 0:
+                        return
+                    self.condition.wait(wait)
+                    continue
+
+            # send outside the lock so producers don't block
+            for recipient, text in messages:
+                self.sendFunction(recipient, text)
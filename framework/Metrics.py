@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Metrics - counters, gauges and latency histograms for the bots,
+    with output in the Prometheus text format
+    Part of the InnoXMPP framework
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+
+from framework.AtomicFile import writeFileAtomically
+
+
+# default histogram buckets (upper bounds in seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+class Histogram():
+    """
+    Histogram - count observations in fixed buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Designated initializer
+        """
+        self.buckets = buckets
+        # one more bucket for observations above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        add an observation
+        """
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        return upper bound of the bucket containing quantile q
+        (None if there are no observations)
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count > 0:
+                if index < len(self.buckets):
+                    return self.buckets[index]
+                return float("inf")
+        return float("inf")
+
+
+def _formatLabels(labels):
+    """
+    return labels in Prometheus syntax, e.g. {command="help"}
+    """
+    if len(labels) == 0:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name,
+        str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels)
+
+
+class Metrics():
+    """
+    Metrics - collection of all metrics of a bot
+    """
+
+    def __init__(self, prefix="innoxmpp", constLabels=None):
+        """
+        Designated initializer
+
+        prefix      - prefix for all metric names
+        constLabels - labels added to every metric in the output
+        """
+        self.prefix = prefix
+        self.constLabels = tuple(sorted((constLabels or {}).items()))
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        """
+        return hashable key for a label dict
+        """
+        return tuple(sorted((labels or {}).items()))
+
+    def increment(self, name, labels=None, amount=1):
+        """
+        increment counter name
+        """
+        key = self._key(labels)
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        """
+        add observation to histogram name
+        """
+        key = self._key(labels)
+        with self.lock:
+            histograms = self.histograms.setdefault(name, {})
+            histogram = histograms.get(key)
+            if histogram == None:
+                histogram = Histogram()
+                histograms[key] = histogram
+            histogram.observe(value)
+
+    def setGauge(self, name, function, labels=None):
+        """
+        register function returning the current value of gauge name
+        """
+        with self.lock:
+            self.gauges.setdefault(name, {})[self._key(labels)] = function
+
+    @contextmanager
+    def timer(self, name, labels=None):
+        """
+        context manager adding the runtime of its block to histogram name
+        """
+        startTime = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - startTime, labels)
+
+    def getCounter(self, name, labels=None):
+        """
+        return value of counter name
+        """
+        with self.lock:
+            return self.counters.get(name, {}).get(self._key(labels), 0)
+
+    def getHistograms(self, name):
+        """
+        return list of (label dict, histogram) of histogram name
+        """
+        with self.lock:
+            return [(dict(key), histogram) for key, histogram in
+                sorted(self.histograms.get(name, {}).items())]
+
+    def formatPrometheus(self):
+        """
+        return all metrics in the Prometheus text format
+        """
+        lines = []
+        with self.lock:
+            for name, values in sorted(self.counters.items()):
+                fullName = "%s_%s" % (self.prefix, name)
+                lines.append("# TYPE %s counter" % fullName)
+                for key, value in sorted(values.items()):
+                    lines.append("%s%s %s" % (fullName,
+                        _formatLabels(self.constLabels + key), value))
+
+            for name, values in sorted(self.gauges.items()):
+                fullName = "%s_%s" % (self.prefix, name)
+                lines.append("# TYPE %s gauge" % fullName)
+                for key, function in sorted(values.items()):
+                    lines.append("%s%s %s" % (fullName,
+                        _formatLabels(self.constLabels + key), function()))
+
+            for name, histograms in sorted(self.histograms.items()):
+                fullName = "%s_%s" % (self.prefix, name)
+                lines.append("# TYPE %s histogram" % fullName)
+                for key, histogram in sorted(histograms.items()):
+                    labels = self.constLabels + key
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",),
+                            histogram.counts):
+                        cumulative += count
+                        lines.append("%s_bucket%s %d" % (fullName,
+                            _formatLabels(labels + (("le", bound),)),
+                            cumulative))
+                    lines.append("%s_sum%s %s" % (fullName,
+                        _formatLabels(labels), histogram.sum))
+                    lines.append("%s_count%s %d" % (fullName,
+                        _formatLabels(labels), histogram.count))
+
+        return "\n".join(lines) + "\n"
+
+    def writePrometheusFile(self, path):
+        """
+        write all metrics to path (e.g. for the node exporter
+        textfile collector), the file is replaced atomically
+        """
+        writeFileAtomically(path, self.formatPrometheus())
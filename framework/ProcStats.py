@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+    ProcStats - read Linux system statistics directly from /proc
+    Part of the InnoXMPP framework
+"""
+
+import os
+import threading
+import time
+
+
+class ProcFile():
+    """
+    ProcFile - a /proc file kept open and re-read from the start
+    """
+
+    def __init__(self, path):
+        """
+        Designated initializer
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        """
+        return current content of the file
+        """
+        chunks = []
+        offset = 0
+        while True:
+            chunk = os.pread(self.fd, 65536, offset)
+            if len(chunk) == 0:
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+        return b"".join(chunks).decode("ascii", "replace")
+
+    def close(self):
+        """
+        close the file handle
+        """
+        os.close(self.fd)
+
+
+class ProcStats():
+    """
+    ProcStats - system statistics, rates are computed from the
+    difference to the previous sample
+    """
+
+    # sector size used by /proc/diskstats, independent of the device
+    SECTOR_SIZE = 512
+
+    def __init__(self, procPath="/proc"):
+        """
+        Designated initializer
+        """
+        self.procPath = procPath
+        self.files = {}
+        self.lock = threading.Lock()
+
+        # previous samples for rate computations
+        self.lastCPU = None
+        self.lastNet = None
+        self.lastIO = None
+
+    def _read(self, name):
+        """
+        return content of /proc file name, open it on first access
+        """
+        procFile = self.files.get(name)
+        if procFile == None:
+            procFile = ProcFile(os.path.join(self.procPath, name))
+            self.files[name] = procFile
+        return procFile.read()
+
+    def close(self):
+        """
+        close all open /proc files
+        """
+        for procFile in self.files.values():
+            procFile.close()
+        self.files = {}
+
+    def uptime(self):
+        """
+        return system uptime in seconds
+        """
+        return float(self._read("uptime").split()[0])
+
+    def loadavg(self):
+        """
+        return load averages (1, 5, 15 min) and running/total processes
+        """
+        fields = self._read("loadavg").split()
+        return float(fields[0]), float(fields[1]), float(fields[2]), fields[3]
+
+    def meminfo(self):
+        """
+        return dict of /proc/meminfo values in kB
+        """
+        result = {}
+        for line in self._read("meminfo").splitlines():
+            name, _, value = line.partition(":")
+            fields = value.split()
+            if len(fields) > 0:
+                result[name] = int(fields[0])
+        return result
+
+    def cpu(self):
+        """
+        return dict of CPU time shares (in percent) since the last call,
+        since boot on the first call
+        """
+        fields = self._read("stat").splitlines()[0].split()
+        names = ("user", "nice", "system", "idle", "iowait", "irq",
+            "softirq", "steal")
+        values = [int(value) for value in fields[1:1 + len(names)]]
+
+        with self.lock:
+            last = self.lastCPU
+            self.lastCPU = values
+
+        if last != None:
+            values = [value - lastValue
+                for value, lastValue in zip(values, last)]
+
+        total = sum(values)
+        if total == 0:
+            return dict((name, 0.0) for name in names)
+        return dict((name, 100.0 * value / total)
+            for name, value in zip(names, values))
+
+    def _rates(self, counters, last, timestamp):
+        """
+        return per second rates of counters relative to the previous
+        sample (averages since boot for the first sample)
+        """
+        if last == None:
+            lastTimestamp = timestamp - self.uptime()
+            lastCounters = {}
+        else:
+            lastTimestamp, lastCounters = last
+
+        interval = max(timestamp - lastTimestamp, 1e-6)
+        rates = {}
+        for name, values in counters.items():
+            lastValues = lastCounters.get(name, [0] * len(values))
+            rates[name] = [(value - lastValue) / interval
+                for value, lastValue in zip(values, lastValues)]
+        return rates
+
+    def net(self):
+        """
+        return dict of interface -> (rx bytes/s, tx bytes/s)
+        """
+        counters = {}
+        # skip the two header lines
+        for line in self._read("net/dev").splitlines()[2:]:
+            interface, _, values = line.partition(":")
+            fields = values.split()
+            counters[interface.strip()] = [int(fields[0]), int(fields[8])]
+
+        timestamp = time.time()
+        with self.lock:
+            last = self.lastNet
+            self.lastNet = (timestamp, counters)
+        return self._rates(counters, last, timestamp)
+
+    def io(self):
+        """
+        return dict of device -> (reads/s, writes/s, read bytes/s,
+        written bytes/s), partitions and idle devices are skipped
+        """
+        # whole disks are listed in /sys/block, partitions are not ('/'
+        # in device names is replaced by '!' there)
+        try:
+            disks = set(name.replace("!", "/")
+                for name in os.listdir("/sys/block"))
+        except OSError:
+            disks = None
+
+        counters = {}
+        for line in self._read("diskstats").splitlines():
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            device = fields[2]
+            # partitions would count the I/O of their disk twice
+            if disks != None and device not in disks:
+                continue
+            # skip pseudo devices which never saw any I/O
+            if int(fields[3]) == 0 and int(fields[7]) == 0:
+                continue
+            counters[device] = [int(fields[3]), int(fields[7]),
+                int(fields[5]) * self.SECTOR_SIZE,
+                int(fields[9]) * self.SECTOR_SIZE]
+
+        timestamp = time.time()
+        with self.lock:
+            last = self.lastIO
+            self.lastIO = (timestamp, counters)
+        return self._rates(counters, last, timestamp)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""
+    ResultCache - memory-bounded LRU cache for paginated command results
+    Part of the InnoXMPP framework
+"""
+
+import collections
+import threading
+
+
+def splitIntoPages(text, pageSize):
+    """
+    split text into pages of at most pageSize characters,
+    pages are split at line boundaries where possible
+    """
+    pages = []
+    current = []
+    currentLength = 0
+
+    for line in text.split("\n"):
+        # split lines which don't fit on a page at all
+        while len(line) > pageSize:
+            if len(current) > 0:
+                pages.append("\n".join(current))
+                current = []
+                currentLength = 0
+            pages.append(line[:pageSize])
+            line = line[pageSize:]
+
+        # the line separator counts as one character
+        if len(current) > 0 and currentLength + 1 + len(line) > pageSize:
+            pages.append("\n".join(current))
+            current = []
+            currentLength = 0
+
+        if len(current) > 0:
+            currentLength += 1
+        current.append(line)
+        currentLength += len(line)
+
+    if len(current) > 0:
+        pages.append("\n".join(current))
+
+    return pages
+
+
+class CachedResult():
+    """
+    CachedResult - all pages of a command result
+    """
+
+    def __init__(self, pages):
+        """
+        Designated initializer
+        """
+        self.pages = pages
+        self.size = sum(len(page) for page in pages)
+
+
+class ResultCache():
+    """
+    ResultCache - keep the latest paginated result per key, drop least
+    recently used results if the cache exceeds its size
+    """
+
+    def __init__(self, maxSize):
+        """
+        Designated initializer
+
+        maxSize - maximal number of characters kept for all results
+        """
+        self.maxSize = maxSize
+        self.size = 0
+        self.results = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, key, pages):
+        """
+        store pages for key, replacing the former result for key
+        """
+        result = CachedResult(pages)
+        with self.lock:
+            self._remove(key)
+            # results which would flush the complete cache are not kept
+            if result.size > self.maxSize:
+                return
+            self.results[key] = result
+            self.size += result.size
+            while self.size > self.maxSize:
+                oldestKey = next(iter(self.results))
+                self._remove(oldestKey)
+
+    def get(self, key):
+        """
+        return result stored for key (None if not cached)
+        """
+        with self.lock:
+            result = self.results.get(key)
+            if result != None:
+                self.results.move_to_end(key)
+            return result
+
+    def _remove(self, key):
+        """
+        remove result for key (lock must be held)
+        """
+        result = self.results.pop(key, None)
+        if result != None:
+            self.size -= result.size
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+    RingBuffer - fixed-size, array-backed time series of samples
+    Part of the InnoXMPP framework
+"""
+
+from array import array
+
+
+class RingBuffer():
+    """
+    RingBuffer - keep the latest (timestamp, value) samples
+    """
+
+    def __init__(self, capacity):
+        """
+        Designated initializer
+
+        capacity - number of samples to keep
+        """
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0] * capacity)
+        self.values = array("d", [0.0] * capacity)
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, value):
+        """
+        add sample, overwrite the oldest sample if the buffer is full
+        """
+        index = (self.start + self.count) % self.capacity
+        self.timestamps[index] = timestamp
+        self.values[index] = value
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def samples(self, since=None):
+        """
+        return list of (timestamp, value) ordered from oldest to newest,
+        only samples not older than since if given
+        """
+        result = []
+        for offset in range(self.count):
+            index = (self.start + offset) % self.capacity
+            if since == None or self.timestamps[index] >= since:
+                result.append((self.timestamps[index], self.values[index]))
+        return result
+
+    def latest(self):
+        """
+        return newest sample (None if empty)
+        """
+        if self.count == 0:
+            return None
+        index = (self.start + self.count - 1) % self.capacity
+        return self.timestamps[index], self.values[index]
+
+    def downsample(self, points):
+        """
+        return at most points samples, each the average of an equally
+        sized group of consecutive samples
+        """
+        samples = self.samples()
+        if len(samples) <= points:
+            return samples
+
+        result = []
+        for group in range(points):
+            first = group * len(samples) // points
+            last = (group + 1) * len(samples) // points
+            chunk = samples[first:last]
+            result.append((chunk[-1][0],
+                sum(value for _, value in chunk) / len(chunk)))
+        return result
+
+    def slope(self, since=None):
+        """
+        return change of value per second (least squares fit over the
+        samples not older than since), None if there are too few samples
+        """
+        samples = self.samples(since)
+        if len(samples) < 2:
+            return None
+
+        # shift timestamps to keep the numbers small
+        origin = samples[0][0]
+        count = len(samples)
+        meanTime = sum(timestamp - origin for timestamp, _ in samples) / count
+        meanValue = sum(value for _, value in samples) / count
+
+        numerator = 0.0
+        denominator = 0.0
+        for timestamp, value in samples:
+            deltaTime = timestamp - origin - meanTime
+            numerator += deltaTime * (value - meanValue)
+            denominator += deltaTime * deltaTime
+
+        if denominator == 0:
+            return None
+        return numerator / denominator
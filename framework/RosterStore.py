@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+    RosterStore - keep a copy of the roster and its version on disk, used
+    as SleekXMPP roster backend so the server only sends changes
+    (roster versioning) after a restart
+    Part of the InnoXMPP framework
+"""
+
+import json
+import os
+import threading
+
+from framework.AtomicFile import writeJSONAtomically
+
+
+class RosterStore():
+    """
+    RosterStore - roster backend persisted in a JSON file
+
+    Implements the backend interface of sleekxmpp.roster (entries, load,
+    save, version, set_version). Changes are kept in memory and written
+    by flush(), so a full roster download doesn't write the file once
+    per item.
+    """
+
+    def __init__(self, path):
+        """
+        Designated initializer
+
+        path - JSON file to keep the roster in
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.dirty = False
+        # owner JID -> {"version": ..., "items": {jid: item state}}
+        self.rosters = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path) as rosterFile:
+                    self.rosters = json.load(rosterFile)
+            except (OSError, ValueError):
+                # a broken copy only costs a full roster download
+                self.rosters = {}
+
+    def _getRoster(self, owner):
+        """
+        return stored roster of owner (lock must be held)
+        """
+        return self.rosters.setdefault(str(owner),
+            {"version": "", "items": {}})
+
+    def entries(self, owner, db_state=None):
+        """
+        return JIDs in the roster of owner (all owners if None)
+        """
+        with self.lock:
+            if owner == None:
+                return list(self.rosters)
+            return list(self._getRoster(owner)["items"])
+
+    def load(self, owner, jid, db_state=None):
+        """
+        return stored state of roster item jid, None if unknown
+        """
+        with self.lock:
+            item = self._getRoster(owner)["items"].get(str(jid))
+            if item == None:
+                return None
+            item = dict(item)
+            item["groups"] = list(item.get("groups", []))
+            return item
+
+    def save(self, owner, jid, item_state, db_state=None):
+        """
+        store state of roster item jid, a removed subscription drops it
+        """
+        with self.lock:
+            items = self._getRoster(owner)["items"]
+            if item_state.get("removed") or \
+                    item_state.get("subscription") == "remove":
+                items.pop(str(jid), None)
+            else:
+                items[str(jid)] = dict((key, list(value)
+                        if isinstance(value, (set, tuple)) else value)
+                    for key, value in item_state.items())
+            self.dirty = True
+
+    def version(self, owner):
+        """
+        return stored roster version of owner
+        """
+        with self.lock:
+            return self._getRoster(owner)["version"]
+
+    def set_version(self, owner, version):
+        """
+        store roster version of owner
+        """
+        with self.lock:
+            self._getRoster(owner)["version"] = version
+            self.dirty = True
+
+    def flush(self):
+        """
+        write the roster file if anything has changed, the file is
+        replaced atomically
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+            writeJSONAtomically(self.path, self.rosters, default=list)
+            self.dirty = False
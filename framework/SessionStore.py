@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SessionStore - per-sender state of a bot (e.g. the default repository
+    or the page of a long result), bounded in size and expiring when idle
+    Part of the InnoXMPP framework
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from framework.AtomicFile import writeJSONAtomically
+
+
+class Session():
+    """
+    Session - the state kept for a single sender
+    """
+
+    def __init__(self, jid, values=None, lastUsed=None):
+        """
+        Designated initializer
+        """
+        self.jid = jid
+        self.values = dict(values or {})
+        self.lastUsed = lastUsed if lastUsed != None else time.time()
+
+    def get(self, key, default=None):
+        """
+        return value of key, default if not set
+        """
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        """
+        set value of key, None removes it
+        """
+        if value == None:
+            self.values.pop(key, None)
+        else:
+            self.values[key] = value
+
+
+class SessionStore():
+    """
+    SessionStore - sessions by bare JID, the least recently used session
+    is dropped if there are more than maxSessions, sessions unused for
+    idleTimeout seconds are dropped by expire()
+    """
+
+    def __init__(self, maxSessions=1000, idleTimeout=86400, stateFile=None):
+        """
+        Designated initializer
+
+        stateFile - JSON file to persist the sessions in (None = off)
+        """
+        self.maxSessions = maxSessions
+        self.idleTimeout = idleTimeout
+        self.stateFile = stateFile
+        self.sessions = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, jid, now=None):
+        """
+        return session of jid, a new one is created if there is none
+        """
+        if now == None:
+            now = time.time()
+        with self.lock:
+            session = self.sessions.get(jid)
+            if session == None or now - session.lastUsed > self.idleTimeout:
+                session = Session(jid, lastUsed=now)
+                self.sessions[jid] = session
+            session.lastUsed = now
+            self.sessions.move_to_end(jid)
+            while len(self.sessions) > self.maxSessions:
+                self.sessions.popitem(last=False)
+            return session
+
+    def expire(self, now=None):
+        """
+        drop sessions which have been idle for too long
+        """
+        if now == None:
+            now = time.time()
+        with self.lock:
+            for jid in [jid for jid, session in self.sessions.items()
+                    if now - session.lastUsed > self.idleTimeout]:
+                del self.sessions[jid]
+
+    def __len__(self):
+        """
+        return number of sessions
+        """
+        with self.lock:
+            return len(self.sessions)
+
+    def loadState(self):
+        """
+        load persisted sessions
+        """
+        if self.stateFile == None or not os.path.exists(self.stateFile):
+            return
+        try:
+            with open(self.stateFile) as stateHandle:
+                state = json.load(stateHandle)
+        except (OSError, ValueError):
+            return
+
+        with self.lock:
+            # the state file is ordered from least to most recently used
+            for jid, session in state:
+                self.sessions[jid] = Session(jid, session["values"],
+                    session["lastUsed"])
+        self.expire()
+
+    def saveState(self):
+        """
+        persist sessions, the file is replaced atomically
+        """
+        if self.stateFile == None:
+            return
+        with self.lock:
+            state = [(jid, {"values": session.values,
+                    "lastUsed": session.lastUsed})
+                for jid, session in self.sessions.items()]
+            writeJSONAtomically(self.stateFile, state)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+"""
+    TaskScheduler - run periodic tasks in a worker pool with overlap
+    protection and jitter
+    Part of the InnoXMPP framework
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScheduledTask():
+    """
+    ScheduledTask - a task and its run statistics
+    """
+
+    def __init__(self, name, interval, function, repeat, owner=None):
+        """
+        Designated initializer
+        """
+        self.name = name
+        self.owner = owner
+        self.interval = interval
+        self.function = function
+        self.repeat = repeat
+
+        self.running = False
+        self.removed = False
+        self.nextRun = None
+        self.lastRun = None
+        self.lastDuration = None
+        self.runs = 0
+        self.errors = 0
+        # runs skipped because the previous run was still going
+        self.overruns = 0
+
+
+class TaskScheduler():
+    """
+    TaskScheduler - schedule tasks and execute them off the event thread
+    """
+
+    def __init__(self, maxWorkers=2, jitter=0.0, logger=None):
+        """
+        Designated initializer
+
+        maxWorkers - number of tasks that may run in parallel
+        jitter     - max. random seconds added to every scheduled run
+        """
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.jitter = jitter
+        self.logger = logger
+
+        self.tasks = {}
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def _enqueue(self, task, delay):
+        """
+        schedule next run of task in delay seconds (lock must be held)
+        """
+        task.nextRun = time.time() + delay + random.uniform(0, self.jitter)
+        heapq.heappush(self.queue, (task.nextRun, next(self.sequence), task))
+        self.condition.notify()
+
+    def addTask(self, name, interval, function, repeat=True, owner=None):
+        """
+        add task which runs every interval seconds (or once after
+        interval seconds if repeat is False), replaces a task with
+        the same name and owner
+
+        owner - distinguishes tasks of several bots sharing the scheduler
+        """
+        task = ScheduledTask(name, interval, function, repeat, owner)
+        with self.condition:
+            oldTask = self.tasks.get((owner, name))
+            if oldTask != None:
+                oldTask.removed = True
+            self.tasks[(owner, name)] = task
+            self._enqueue(task, interval)
+        return task
+
+    def removeTask(self, name, owner=None):
+        """
+        remove task with given name and owner
+        """
+        with self.condition:
+            task = self.tasks.pop((owner, name), None)
+            if task != None:
+                task.removed = True
+
+    def removeTasks(self, owner):
+        """
+        remove all tasks of owner
+        """
+        with self.condition:
+            for key in [key for key in self.tasks if key[0] == owner]:
+                self.tasks.pop(key).removed = True
+
+    def getTasks(self, owner=None):
+        """
+        return list of all tasks of owner ordered by name
+        """
+        with self.condition:
+            return [self.tasks[key] for key in
+                sorted(key for key in self.tasks if key[0] == owner)]
+
+    def getTask(self, name, owner=None):
+        """
+        return task of owner with given name (case insensitive),
+        None if unknown
+        """
+        with self.condition:
+            for (taskOwner, taskName), task in self.tasks.items():
+                if taskOwner == owner and taskName.lower() == name.lower():
+                    return task
+        return None
+
+    def runTask(self, task):
+        """
+        run task right away in the worker pool
+
+        returns False if the task is still running
+        """
+        with self.condition:
+            if task.running:
+                task.overruns += 1
+                return False
+            task.running = True
+
+        self.executor.submit(self._execute, task)
+        return True
+
+    def _execute(self, task):
+        """
+        run task and record its statistics
+        """
+        startTime = time.time()
+        try:
+            task.function()
+        except Exception:
+            task.errors += 1
+            if self.logger != None:
+                self.logger.exception("Task '%s' failed", task.name)
+        finally:
+            task.lastRun = startTime
+            task.lastDuration = time.time() - startTime
+            task.runs += 1
+            task.running = False
+
+    def start(self):
+        """
+        start the scheduling thread
+        """
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="TaskScheduler")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        stop the scheduling thread and the worker pool
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        self.executor.shutdown(wait=False)
+
+    def _run(self):
+        """
+        scheduling thread main loop
+        """
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+
+                # drop removed tasks from the queue
+                while len(self.queue) > 0 and self.queue[0][2].removed:
+                    heapq.heappop(self.queue)
+
+                if len(self.queue) == 0:
+                    self.condition.wait()
+                    continue
+
+                nextRun, _, task = self.queue[0]
+                wait = nextRun - time.time()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                heapq.heappop(self.queue)
+                if task.repeat:
+                    self._enqueue(task, task.interval)
+                else:
+                    del self.tasks[(task.owner, task.name)]
+
+            if not self.runTask(task) and self.logger != None:
+                self.logger.info("Task '%s' still running, skipping run",
+                    task.name)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    multi_bot - startup script to run several XMPP bots in one process,
+    the bots to run are listed in the [BotRunner] section of the config file
+    Copyright (C) 2012 Bjoern Stierand
+"""
+
+import argparse
+
+from framework.BotRunner import BotRunner
+
+# only look at the config file here, BotRunner parses all other options
+parser = argparse.ArgumentParser(add_help=False)
+parser.add_argument("--config", default="config/innoxmpp.ini")
+arguments, _ = parser.parse_known_args()
+
+# set up BotRunner with all configured bots and start them up
+multiBot = BotRunner(*BotRunner.loadBotClasses(arguments.config))
+multiBot.run()